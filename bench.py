@@ -0,0 +1,286 @@
+"""Офлайн-замеры бота: нагрузка через фейковый Bot API и тяжёлые запросы к БД.
+
+Настоящий Dispatcher из timebot.py работает против fake_telegram.FakeTelegram,
+виртуальные пользователи проходят полный сценарий (таймер, описание, отчет,
+CSV), а генератор заполняет базу миллионами задач, чтобы регрессии в
+админской статистике и экспорте были видны до выкладки.
+
+    python bench.py seed --users 20000 --tasks 2000000
+    python bench.py queries
+    python bench.py load --concurrency 50 --rounds 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from fake_telegram import FakeTelegram, configure_bot_env, percentile, running_bot
+
+# Сгенерированные пользователи начинаются отсюда, виртуальные — после всех существующих
+SEED_FIRST_USER_ID = 100_000
+LOAD_FIRST_USER_ID = 100_000_000
+# Сколько строк вставлять одной транзакцией при генерации
+SEED_BATCH = 50_000
+
+# Сценарий одного пользователя: (шаг, текст, сколько сообщений ответит бот)
+SCENARIO = [
+    ("start_timer", "⏰ Начать", 1),
+    ("save_task_number", "Задача {n}", 1),
+    ("stop_timer", "⏹️ Стоп", 2),
+    ("description_choice", "✅ Да", 1),
+    ("save_description", "Разбор почты и созвон по задаче {n}", 1),
+    ("daily_report_today", "📊 Отчет за сегодня", 1),
+    ("reports_submenu", "🔄 Другие отчеты", 1),
+    ("export_to_csv", "📥 Экспорт в CSV", 2),
+]
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+# ================== ГЕНЕРАТОР БАЗЫ ==================
+def _seed_rows(rng: random.Random, users: int, tasks: int, days: int, today: date):
+    """Строки tasks: задачи поровну по пользователям, по возрастанию даты"""
+    per_user, extra = divmod(tasks, users)
+    for offset in range(users):
+        user_id = SEED_FIRST_USER_ID + offset
+        names = [f"Задача {n}" for n in rng.sample(range(1, 1000), rng.randint(3, 40))]
+        count = per_user + (1 if offset < extra else 0)
+        day_offsets = sorted((rng.randrange(days) for _ in range(count)), reverse=True)
+        for day_offset in day_offsets:
+            description = f"Описание {rng.randrange(10 ** 6)}" if rng.random() < 0.3 else None
+            yield (
+                user_id,
+                rng.choice(names),
+                rng.randint(60, 4 * 3600),
+                (today - timedelta(days=day_offset)).isoformat(),
+                f"{rng.randrange(24):02d}:{rng.randrange(60):02d}",
+                description,
+            )
+
+
+def seed(users: int, tasks: int, days: int = 365, premium_share: float = 0.1, seed_value: int = 1):
+    """Заполняет DATA_DIR/tasks.db пользователями и задачами, затем пересчитывает агрегаты"""
+    import db
+
+    db.init_db()
+    rng = random.Random(seed_value)
+    today = date.today()
+    started = time.perf_counter()
+
+    with db.connection() as conn:
+        conn.executemany(
+            """
+            INSERT OR IGNORE INTO users (user_id, username, first_name, joined_date, is_admin, is_premium)
+            VALUES (?, ?, ?, ?, 0, ?)
+            """,
+            (
+                (
+                    SEED_FIRST_USER_ID + offset,
+                    f"user{offset}",
+                    f"User{offset}",
+                    (today - timedelta(days=rng.randrange(days))).isoformat(),
+                    1 if rng.random() < premium_share else 0,
+                )
+                for offset in range(users)
+            ),
+        )
+        conn.commit()
+
+        rows = _seed_rows(rng, users, tasks, days, today)
+        inserted = 0
+        while True:
+            batch = [row for _, row in zip(range(SEED_BATCH), rows)]
+            if not batch:
+                break
+            conn.executemany(
+                """
+                INSERT INTO tasks (user_id, task_number, duration, date, time_start, description)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                batch,
+            )
+            conn.commit()
+            inserted += len(batch)
+            print(f"  вставлено задач: {inserted}/{tasks}", end="\r")
+    print()
+
+    db.rebuild_aggregates.sync()
+    with db.connection() as conn:
+        conn.execute("ANALYZE")
+    db.shutdown()
+    print(f"🌱 База заполнена за {time.perf_counter() - started:.1f} с: {users} пользователей, {tasks} задач")
+
+
+# ================== ЗАМЕР ЗАПРОСОВ ==================
+def _busiest_user() -> int:
+    import db
+
+    with db.connection() as conn:
+        row = conn.execute(
+            "SELECT user_id FROM user_totals ORDER BY task_count DESC LIMIT 1"
+        ).fetchone()
+    return row[0] if row else 0
+
+
+def bench_queries(repeat: int = 5) -> dict:
+    """Время тяжёлых запросов к БД (синхронно, без event loop)"""
+    import db
+
+    db.init_db()
+    user_id = _busiest_user()
+    today = date.today()
+
+    def csv_export():
+        path, _ = db.generate_csv_report.sync(user_id)
+        path.unlink(missing_ok=True)
+
+    queries = {
+        "get_statistics": lambda: db.get_statistics.sync(),
+        "get_all_users": lambda: db.get_all_users.sync(),
+        "get_users_page": lambda: db.get_users_page.sync(0, 40),
+        "generate_csv_report": csv_export,
+        "get_range_summary_year": lambda: db.get_range_summary.sync(
+            user_id, (today - timedelta(days=365)).isoformat(), today.isoformat()
+        ),
+    }
+
+    results = {}
+    for name, query in queries.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            timings.append(time.perf_counter() - started)
+        results[name] = {
+            "min_ms": _ms(min(timings)),
+            "median_ms": _ms(statistics.median(timings)),
+            "max_ms": _ms(max(timings)),
+        }
+        print(f"{name}: {json.dumps(results[name])}")
+    db.shutdown()
+    return results
+
+
+# ================== НАГРУЗКА ==================
+async def _prepare_users(db, user_ids: list[int]):
+    """Регистрирует виртуальных пользователей с премиумом (нужен для CSV)"""
+    for user_id in user_ids:
+        await db.log_user(user_id, f"bench{user_id}", f"Bench{user_id}")
+        await db.set_premium_status(user_id, 1)
+
+
+async def run_scenario(fake: FakeTelegram, user_ids: list[int], rounds: int) -> dict:
+    """Гоняет пользователей по SCENARIO rounds раз; задержки по шагам"""
+    latencies: dict[str, list[float]] = {step: [] for step, _, _ in SCENARIO}
+
+    async def user(user_id: int):
+        for n in range(rounds):
+            for step, text, expected in SCENARIO:
+                update = fake.message_update(user_id, text.format(n=n))
+                latency, _ = await fake.ask(user_id, update, expected)
+                latencies[step].append(latency)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(user_id) for user_id in user_ids))
+    elapsed = time.perf_counter() - started
+
+    everything = [value for values in latencies.values() for value in values]
+    return {
+        "updates": len(everything),
+        "seconds": round(elapsed, 2),
+        "updates_per_sec": round(len(everything) / elapsed, 1),
+        "p50_ms": _ms(percentile(everything, 50)),
+        "p99_ms": _ms(percentile(everything, 99)),
+        "steps": {
+            step: {"p50_ms": _ms(percentile(values, 50)), "p99_ms": _ms(percentile(values, 99))}
+            for step, values in latencies.items()
+        },
+    }
+
+
+def contention_report(db, metrics) -> dict:
+    """Ожидание потоков БД, соединений и блокировки записи за прогон"""
+    waits = {
+        row["kind"]: {"count": row["count"], "p99_ms": round(row["p99_ms"], 2), "total_ms": _ms(row["total_s"])}
+        for row in metrics.histogram_summary("timebot_db_wait_seconds", "kind")
+    }
+    return {"waits": waits, "pool": db.pool_stats(), "writes": db.write_stats()}
+
+
+async def bench_load(concurrency: int, rounds: int, mode: str, api_port: int, webhook_port: int) -> dict:
+    configure_bot_env(api_port, webhook_port)
+    fake = FakeTelegram()
+    await fake.start(port=api_port)
+
+    import db
+    import timebot
+    from metrics import metrics
+
+    # новые пользователи на каждый запуск: на общей базе не остаётся чужих таймеров
+    with db.connection() as conn:
+        last_user_id = conn.execute("SELECT MAX(user_id) FROM users").fetchone()[0] or 0
+    first_user_id = max(LOAD_FIRST_USER_ID, last_user_id + 1)
+    user_ids = list(range(first_user_id, first_user_id + concurrency))
+    try:
+        await _prepare_users(db, user_ids)
+        async with running_bot(fake, timebot, mode, webhook_port):
+            result = await run_scenario(fake, user_ids, rounds)
+        await db.flush_writes()
+        result["handlers"] = {
+            row["handler"]: {"count": row["count"], "avg_ms": round(row["avg_ms"], 2), "p99_ms": round(row["p99_ms"], 2)}
+            for row in metrics.histogram_summary("timebot_handler_duration_seconds", "handler")
+        }
+        result["sqlite"] = contention_report(db, metrics)
+    finally:
+        await timebot.storage.close()
+        await fake.stop()
+
+    print(f"{mode}: {json.dumps(result, ensure_ascii=False, indent=2)}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-замеры бота и базы")
+    parser.add_argument(
+        "--data-dir",
+        default=os.getenv("DATA_DIR", os.path.join(tempfile.gettempdir(), "timebot-bench")),
+        help="папка с tasks.db (общая для seed, queries и load)",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="заполнить базу синтетическими данными")
+    seed_parser.add_argument("--users", type=int, default=10000)
+    seed_parser.add_argument("--tasks", type=int, default=1_000_000)
+    seed_parser.add_argument("--days", type=int, default=365)
+    seed_parser.add_argument("--seed", type=int, default=1)
+
+    queries_parser = commands.add_parser("queries", help="время тяжёлых запросов к БД")
+    queries_parser.add_argument("--repeat", type=int, default=5)
+
+    load_parser = commands.add_parser("load", help="нагрузка через фейковый Bot API")
+    load_parser.add_argument("--concurrency", type=int, default=20)
+    load_parser.add_argument("--rounds", type=int, default=3)
+    load_parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    load_parser.add_argument("--api-port", type=int, default=8081)
+    load_parser.add_argument("--webhook-port", type=int, default=8082)
+
+    args = parser.parse_args()
+    os.environ["DATA_DIR"] = args.data_dir
+
+    if args.command == "seed":
+        seed(args.users, args.tasks, args.days, seed_value=args.seed)
+    elif args.command == "queries":
+        bench_queries(args.repeat)
+    else:
+        asyncio.run(bench_load(args.concurrency, args.rounds, args.mode, args.api_port, args.webhook_port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import asyncio
+import os
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+)
+
+import db
+from ratelimit import ChatRateLimiter
+
+# ================== НАСТРОЙКИ РАССЫЛОК ==================
+# Общий лимит Telegram ~30 сообщений/с на бота, оставляем запас
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+# Сколько сообщений отправляется одновременно
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+# Сколько получателей читается из БД и записывается в БД за раз
+BROADCAST_BATCH = 200
+# Сколько раз повторять отправку после RetryAfter
+BROADCAST_MAX_ATTEMPTS = 5
+
+
+def classify_send_error(error: Exception) -> str | None:
+    """Причина, по которой чат недоступен навсегда, или None для временных ошибок"""
+    text = str(error).lower()
+    if isinstance(error, TelegramForbiddenError):
+        if "deactivated" in text:
+            return "deactivated"
+        return "blocked"
+    if isinstance(error, TelegramNotFound) or (
+        isinstance(error, TelegramBadRequest) and "chat not found" in text
+    ):
+        return "chat_not_found"
+    return None
+
+
+class BroadcastEngine:
+    """Выполняет рассылки из очереди в БД: с лимитами Telegram, паузой и возобновлением"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        limiter: ChatRateLimiter | None = None,
+        concurrency: int = BROADCAST_CONCURRENCY,
+    ):
+        self.bot = bot
+        self.limiter = limiter or ChatRateLimiter(BROADCAST_RATE)
+        self.concurrency = concurrency
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._stop_events: dict[int, asyncio.Event] = {}
+
+    def start(self, job_id: int):
+        """Запускает (или продолжает) рассылку в фоне"""
+        if job_id in self._tasks:
+            return
+        self._stop_events[job_id] = asyncio.Event()
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._forget(job_id))
+
+    def _forget(self, job_id: int):
+        self._tasks.pop(job_id, None)
+        self._stop_events.pop(job_id, None)
+
+    async def _stop(self, job_id: int):
+        """Останавливает рассылку после уже начатых отправок"""
+        task = self._tasks.get(job_id)
+        if task:
+            self._stop_events[job_id].set()
+            await task
+
+    async def pause(self, job_id: int) -> bool:
+        if not await db.set_broadcast_status(job_id, "paused"):
+            return False
+        await self._stop(job_id)
+        return True
+
+    async def cancel(self, job_id: int) -> bool:
+        if not await db.set_broadcast_status(job_id, "cancelled"):
+            return False
+        await self._stop(job_id)
+        return True
+
+    async def resume(self, job_id: int) -> bool:
+        if not await db.set_broadcast_status(job_id, "running"):
+            return False
+        self.start(job_id)
+        return True
+
+    async def resume_unfinished(self) -> int:
+        """Продолжает рассылки, прерванные рестартом"""
+        job_ids = await db.get_broadcast_ids("running")
+        for job_id in job_ids:
+            self.start(job_id)
+        return len(job_ids)
+
+    async def shutdown(self):
+        """Останавливает все рассылки; в БД они остаются running и продолжатся после рестарта"""
+        for job_id in list(self._tasks):
+            await self._stop(job_id)
+
+    async def _send(self, job: dict, user_id: int):
+        if job["kind"] == "photo":
+            caption = job["text"] or ""
+            await self.bot.send_photo(
+                chat_id=user_id,
+                photo=job["photo_id"],
+                caption=caption,
+                parse_mode="Markdown" if caption else None,
+            )
+        else:
+            await self.bot.send_message(user_id, job["text"], parse_mode="Markdown")
+
+    async def _deliver(self, job: dict, user_id: int) -> tuple[str, str | None]:
+        """Отправляет одно сообщение, повторяя после RetryAfter; возвращает (статус, ошибка)"""
+        for _ in range(BROADCAST_MAX_ATTEMPTS):
+            await self.limiter.acquire(user_id)
+            try:
+                await self._send(job, user_id)
+                return "sent", None
+            except TelegramRetryAfter as e:
+                self.limiter.retry_after(e.retry_after)
+            except Exception as e:
+                reason = classify_send_error(e)
+                if reason:
+                    return "unreachable", reason
+                print(f"Ошибка отправки пользователю {user_id}: {e}")
+                return "failed", str(e)
+        return "failed", "RetryAfter: превышено число попыток"
+
+    async def _run(self, job_id: int):
+        job = await db.get_broadcast(job_id)
+        if not job or job["status"] != "running":
+            return
+
+        stop_event = self._stop_events[job_id]
+        queue: asyncio.Queue[int | None] = asyncio.Queue(maxsize=self.concurrency * 2)
+        results: list[tuple[int, int, str, str | None]] = []
+
+        async def flush():
+            nonlocal results
+            if results:
+                batch, results = results, []
+                await db.mark_recipients(batch)
+                unreachable = [
+                    (user_id, error)
+                    for _, user_id, status, error in batch
+                    if status == "unreachable"
+                ]
+                if unreachable:
+                    await db.mark_users_unreachable(unreachable)
+
+        async def producer():
+            after_user_id = 0
+            while not stop_event.is_set():
+                user_ids = await db.get_pending_recipients(job_id, after_user_id, BROADCAST_BATCH)
+                if not user_ids:
+                    break
+                for user_id in user_ids:
+                    await queue.put(user_id)
+                after_user_id = user_ids[-1]
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def worker():
+            while (user_id := await queue.get()) is not None:
+                if stop_event.is_set():
+                    continue
+                status, error = await self._deliver(job, user_id)
+                results.append((job_id, user_id, status, error))
+                if len(results) >= BROADCAST_BATCH:
+                    await flush()
+
+        try:
+            await asyncio.gather(producer(), *(worker() for _ in range(self.concurrency)))
+        finally:
+            await flush()
+
+        if stop_event.is_set():
+            return
+
+        await db.set_broadcast_status(job_id, "done")
+        job = await db.get_broadcast(job_id)
+        try:
+            await self.bot.send_message(
+                job["admin_chat_id"],
+                f"✅ Рассылка #{job_id} завершена!\n"
+                f"✅ Успешно: {job['sent']}\n"
+                f"❌ Ошибок: {job['failed']}\n"
+                f"🚫 Недоступны (исключены из рассылок): {job['unreachable']}",
+            )
+        except Exception as e:
+            print(f"Не удалось отправить итог рассылки #{job_id}: {e}")
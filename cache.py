@@ -0,0 +1,72 @@
+import time
+from collections import OrderedDict
+
+# Маркер отсутствующего значения (None тоже может быть закэширован)
+MISSING = object()
+
+
+class LRUCache:
+    """LRU-кэш с ограничением размера, временем жизни записей и счётчиками"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # растёт при каждом сбросе: значение, прочитанное до сброса, не кэшируется
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=MISSING):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def generation(self) -> int:
+        """Поколение кэша; запоминается до чтения источника и передаётся в set"""
+        return self._generation
+
+    def set(self, key, value, generation: int | None = None):
+        if generation is not None and generation != self._generation:
+            # пока значение читалось, кэш сбрасывали — оно могло устареть
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+        self._generation += 1
+
+    def clear(self):
+        self._data.clear()
+        self._generation += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,1645 @@
+import asyncio
+import csv
+import functools
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+from pathlib import Path
+
+from cache import LRUCache, MISSING
+from metrics import metrics
+
+# ================== НАСТРОЙКИ БАЗЫ ДАННЫХ ==================
+# Путь к папке data
+DATA_DIR = Path(os.getenv("DATA_DIR", "/data"))
+DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+# Путь к базе данных
+DB_PATH = DATA_DIR / "tasks.db"
+
+# Число потоков, в которых выполняются запросы к БД
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))
+
+# Размер пула соединений (по умолчанию по одному на поток БД)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(DB_WORKERS)))
+
+# PRAGMA для каждого соединения
+DB_CACHE_KB = int(os.getenv("DB_CACHE_KB", "16384"))
+DB_MMAP_BYTES = int(os.getenv("DB_MMAP_BYTES", str(256 * 1024 * 1024)))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Групповая запись: сколько миллисекунд копить записи перед общей транзакцией
+DB_WRITE_DELAY_MS = float(os.getenv("DB_WRITE_DELAY_MS", "5"))
+# Максимум операций в одной транзакции групповой записи
+DB_WRITE_BATCH = int(os.getenv("DB_WRITE_BATCH", "500"))
+
+# Хранилище активных таймеров: sqlite (по умолчанию) или memory
+TIMER_STORE = os.getenv("TIMER_STORE", "sqlite")
+
+# Кэш часовых поясов и премиум-статуса: размер и время жизни записи
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "50000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "600"))
+
+# Отдельный пул потоков: обработчики не блокируют event loop на диске
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+
+# Редко меняющиеся данные пользователя; заполняются при чтении,
+# сбрасываются в save_user_timezone и set_premium_status после коммита.
+# Чтение, во время которого был сброс, в кэш не пишется (generation)
+timezone_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+premium_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+# В шардах (см. sharding.py) премиум читается из БД: /premium выполняется в шарде
+# админа, и сброс кэша не дошёл бы до шарда пользователя
+PREMIUM_CACHE_ENABLED = not os.getenv("BOT_SHARD")
+
+
+def cache_stats() -> dict:
+    """Счётчики попаданий/промахов кэшей пользователей"""
+    return {
+        "timezone": timezone_cache.stats(),
+        "premium": premium_cache.stats(),
+    }
+
+
+# ================== ПУЛ СОЕДИНЕНИЙ ==================
+class ConnectionPool:
+    """Пул долгоживущих соединений SQLite с настроенными PRAGMA"""
+
+    def __init__(self, path: Path, size: int):
+        self.path = path
+        self.size = size
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # статистика
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.in_use = 0
+        self.max_in_use = 0
+
+        for _ in range(size):
+            self._idle.put(self._connect())
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            str(self.path),
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KB}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_BYTES}")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        # LOWER() в SQLite не знает кириллицу — поиск задач сравнивает через casefold
+        conn.create_function("casefold", 1, lambda s: s.casefold() if s else s, deterministic=True)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Выдаёт соединение из пула; при ошибке откатывает транзакцию"""
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            started = time.perf_counter()
+            conn = self._idle.get()
+            waited = time.perf_counter() - started
+            metrics.observe("timebot_db_wait_seconds", waited, kind="pool")
+            with self._lock:
+                self.waits += 1
+                self.wait_seconds += waited
+
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._idle.put(conn)
+
+    def stats(self) -> dict:
+        """Статистика использования пула"""
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_ms_total": round(self.wait_seconds * 1000, 1),
+            }
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool: ConnectionPool | None = None
+
+
+def connection():
+    """Соединение из общего пула (см. init_db)"""
+    return _pool.connection()
+
+
+def pool_stats() -> dict:
+    """Статистика пула соединений"""
+    return _pool.stats() if _pool else {}
+
+
+def _query_name(func) -> str:
+    return func.__qualname__.lstrip("_")
+
+
+def _timed(name: str, submitted: float, func, *args, **kwargs):
+    """Выполняет запрос в потоке БД и пишет в метрики ожидание потока и время запроса"""
+    started = time.perf_counter()
+    metrics.observe("timebot_db_wait_seconds", started - submitted, kind="executor")
+    try:
+        return func(*args, **kwargs)
+    finally:
+        metrics.observe(
+            "timebot_db_query_duration_seconds", time.perf_counter() - started, query=name
+        )
+
+
+def in_executor(func):
+    """Превращает синхронную функцию БД в корутину, выполняемую в пуле потоков БД.
+
+    Исходная синхронная версия доступна как ``func.sync``.
+    """
+    name = _query_name(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _executor,
+            functools.partial(_timed, name, time.perf_counter(), func, *args, **kwargs),
+        )
+
+    wrapper.sync = func
+    return wrapper
+
+
+# ================== ГРУППОВАЯ ЗАПИСЬ ==================
+# Корзины гистограммы размера пачки групповой записи
+WRITE_BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class WriteQueue:
+    """Очередь записей, которые коммитятся пачками в одной транзакции.
+
+    Пока идёт коммит одной пачки, следующая копится в очереди, поэтому
+    в часы пик на много пользователей приходится один fsync. Каждая
+    операция выполняется в своём SAVEPOINT: ошибка одной не откатывает
+    остальные, а попадает только в future вызвавшего.
+    """
+
+    def __init__(self, delay: float = DB_WRITE_DELAY_MS / 1000, max_batch: int = DB_WRITE_BATCH):
+        self.delay = delay
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+        # статистика
+        self.ops = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            if self._loop is not loop:
+                self._queue = asyncio.Queue()
+            self._loop = loop
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, func, *args, **kwargs):
+        """Ставит func(cursor, *args, **kwargs) в очередь и ждёт результат после коммита"""
+        self._ensure_running()
+        future = self._loop.create_future()
+        operation = (_query_name(func), lambda cursor: func(cursor, *args, **kwargs))
+        self._queue.put_nowait((operation, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                results = await self._loop.run_in_executor(
+                    _executor, _timed, "write_batch", time.perf_counter(), self._commit, batch
+                )
+            except Exception as e:
+                results = [(None, e)] * len(batch)
+
+            for (_, future), (result, error) in zip(batch, results):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            for _ in batch:
+                self._queue.task_done()
+
+            metrics.observe("timebot_db_write_batch_size", len(batch), buckets=WRITE_BATCH_BUCKETS)
+            self.ops += len(batch)
+            self.batches += 1
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+
+    @staticmethod
+    def _commit(batch) -> list[tuple]:
+        """Выполняет пачку в одной транзакции: [(результат, ошибка), ...]"""
+        results = []
+        with connection() as conn:
+            cursor = conn.cursor()
+            started = time.perf_counter()
+            cursor.execute("BEGIN IMMEDIATE")
+            metrics.observe("timebot_db_wait_seconds", time.perf_counter() - started, kind="write_lock")
+            for (name, operation), _ in batch:
+                cursor.execute("SAVEPOINT write_op")
+                started = time.perf_counter()
+                try:
+                    results.append((operation(cursor), None))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write_op")
+                    results.append((None, e))
+                metrics.observe(
+                    "timebot_db_query_duration_seconds", time.perf_counter() - started, query=name
+                )
+                cursor.execute("RELEASE write_op")
+            started = time.perf_counter()
+            conn.commit()
+            metrics.observe(
+                "timebot_db_query_duration_seconds", time.perf_counter() - started, query="write_commit"
+            )
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "ops": self.ops,
+            "batches": self.batches,
+            "max_batch": self.max_batch_seen,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+    async def close(self):
+        """Дожидается коммита всех поставленных записей"""
+        if self._task is None or self._loop is not asyncio.get_running_loop():
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+_writes = WriteQueue()
+
+
+def batched_write(func):
+    """Превращает функцию записи func(cursor, ...) в корутину с групповым коммитом.
+
+    Синхронная версия в отдельной транзакции доступна как ``func.sync``.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await _writes.submit(func, *args, **kwargs)
+
+    def sync(*args, **kwargs):
+        with connection() as conn:
+            result = func(conn.cursor(), *args, **kwargs)
+            conn.commit()
+        return result
+
+    wrapper.sync = sync
+    return wrapper
+
+
+def write_stats() -> dict:
+    """Статистика групповой записи"""
+    return _writes.stats()
+
+
+async def flush_writes():
+    """Дописывает очередь групповой записи (перед shutdown)"""
+    await _writes.close()
+
+
+def shutdown():
+    """Дожидается завершения запросов и закрывает пул потоков и соединений"""
+    _executor.shutdown(wait=True)
+    if _pool:
+        _pool.close()
+
+
+# ================== МИГРАЦИИ ==================
+# Версия схемы хранится в PRAGMA user_version. Каждая миграция выполняется
+# один раз в своей транзакции и не должна терять существующие данные.
+def _migration_base_schema(cursor: sqlite3.Cursor):
+    """Исходные таблицы (для старых баз — no-op благодаря IF NOT EXISTS)"""
+    # Таблица пользователей (расширенная)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            joined_date TEXT,
+            is_admin INTEGER DEFAULT 0,
+            is_premium INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Таблица задач
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            task_number TEXT,
+            duration INTEGER,
+            date TEXT,
+            time_start TEXT,
+            description TEXT
+        )
+    ''')
+
+    # Часовые пояса
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_timezones (
+            user_id INTEGER PRIMARY KEY,
+            timezone TEXT
+        )
+    ''')
+
+
+def _migration_task_indexes(cursor: sqlite3.Cursor):
+    """Составные индексы под горячие запросы по tasks"""
+    # отчет за день, MAX(date) и COUNT(*) по пользователю
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_date "
+        "ON tasks (user_id, date, time_start)"
+    )
+    # отчет по задаче и список задач пользователя
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_task "
+        "ON tasks (user_id, task_number, date)"
+    )
+    # покрывающий индекс для админской статистики (активные за период, часы)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tasks_date_user_duration "
+        "ON tasks (date, user_id, duration)"
+    )
+    cursor.execute("ANALYZE tasks")
+
+
+def _migration_active_timers(cursor: sqlite3.Cursor):
+    """Таблица запущенных таймеров (переживает рестарт и общая для процессов)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS active_timers (
+            user_id INTEGER PRIMARY KEY,
+            task_number TEXT NOT NULL,
+            start_time REAL NOT NULL,
+            date TEXT NOT NULL
+        )
+    ''')
+
+
+def _rebuild_aggregates(cursor: sqlite3.Cursor):
+    """Пересчитывает агрегаты с нуля по таблице tasks"""
+    cursor.execute("DELETE FROM user_totals")
+    cursor.execute('''
+        INSERT INTO user_totals (user_id, task_count, total_seconds, last_date)
+        SELECT user_id, COUNT(*), COALESCE(SUM(duration), 0), MAX(date)
+        FROM tasks
+        GROUP BY user_id
+    ''')
+
+    cursor.execute("DELETE FROM daily_active")
+    cursor.execute('''
+        INSERT INTO daily_active (date, user_id)
+        SELECT DISTINCT date, user_id FROM tasks WHERE date IS NOT NULL
+    ''')
+
+    cursor.execute('''
+        INSERT OR REPLACE INTO stats_totals (id, total_users, total_tasks, total_seconds)
+        SELECT 1,
+               (SELECT COUNT(*) FROM user_totals),
+               (SELECT COUNT(*) FROM tasks),
+               (SELECT COALESCE(SUM(duration), 0) FROM tasks)
+    ''')
+
+
+def _migration_aggregates(cursor: sqlite3.Cursor):
+    """Материализованные счётчики для /stats и /user"""
+    # одна строка с общими итогами
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_totals (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_users INTEGER NOT NULL DEFAULT 0,
+            total_tasks INTEGER NOT NULL DEFAULT 0,
+            total_seconds INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # итоги по пользователю
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_totals (
+            user_id INTEGER PRIMARY KEY,
+            task_count INTEGER NOT NULL DEFAULT 0,
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            last_date TEXT
+        )
+    ''')
+    # кто был активен в какой день
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_active (
+            date TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (date, user_id)
+        ) WITHOUT ROWID
+    ''')
+    _rebuild_aggregates(cursor)
+
+
+def _migration_broadcasts(cursor: sqlite3.Cursor):
+    """Очередь рассылок со статусом доставки по каждому получателю"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            admin_chat_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            text TEXT,
+            photo_id TEXT,
+            status TEXT NOT NULL DEFAULT 'running'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            job_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            error TEXT,
+            PRIMARY KEY (job_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_status "
+        "ON broadcast_recipients (job_id, status, user_id)"
+    )
+
+
+def _add_column_if_missing(cursor: sqlite3.Cursor, table: str, column: str, definition: str):
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _migration_user_reachability(cursor: sqlite3.Cursor):
+    """Отметка недоступных пользователей (заблокировали бота, удалены)"""
+    _add_column_if_missing(cursor, "users", "unreachable_since", "TEXT")
+    _add_column_if_missing(cursor, "users", "unreachable_reason", "TEXT")
+    # частичные индексы: выборка получателей читает только живых пользователей
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_reachable "
+        "ON users (user_id) WHERE unreachable_since IS NULL"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_reachable_free "
+        "ON users (user_id) WHERE unreachable_since IS NULL AND is_premium = 0"
+    )
+
+
+def _migration_fsm_states(cursor: sqlite3.Cursor):
+    """Хранилище FSM-состояний aiogram"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)"
+    )
+
+
+def _rebuild_task_catalog(cursor: sqlite3.Cursor):
+    """Пересчитывает каталог задач с нуля по таблице tasks (id задач сохраняются)"""
+    cursor.execute('''
+        INSERT INTO task_catalog (user_id, name, last_used, usage_count, total_seconds)
+        SELECT user_id, task_number, MAX(date || ' ' || time_start), COUNT(*),
+               COALESCE(SUM(duration), 0)
+        FROM tasks
+        WHERE task_number IS NOT NULL
+        GROUP BY user_id, task_number
+        ON CONFLICT (user_id, name) DO UPDATE SET
+            last_used = excluded.last_used,
+            usage_count = excluded.usage_count,
+            total_seconds = excluded.total_seconds
+    ''')
+    cursor.execute('''
+        DELETE FROM task_catalog
+        WHERE NOT EXISTS (
+            SELECT 1 FROM tasks t
+            WHERE t.user_id = task_catalog.user_id AND t.task_number = task_catalog.name
+        )
+    ''')
+
+
+def _migration_task_catalog(cursor: sqlite3.Cursor):
+    """Каталог задач пользователя для выбора задачи в отчёте"""
+    # id — короткий номер задачи для callback_data
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_catalog (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            last_used TEXT NOT NULL,
+            usage_count INTEGER NOT NULL DEFAULT 0,
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (user_id, name)
+        )
+    ''')
+    # список задач от недавних к старым
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_task_catalog_recent "
+        "ON task_catalog (user_id, last_used DESC, id DESC)"
+    )
+    _rebuild_task_catalog(cursor)
+
+
+def _migration_task_report_index(cursor: sqlite3.Cursor):
+    """Индекс под постраничный отчет по задаче (keyset по дате и времени)"""
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_task_time "
+        "ON tasks (user_id, task_number, date, time_start)"
+    )
+    # старый индекс — префикс нового
+    cursor.execute("DROP INDEX IF EXISTS idx_tasks_user_task")
+    cursor.execute("ANALYZE tasks")
+
+
+def _migration_timer_status_message(cursor: sqlite3.Cursor):
+    """Сообщение живого статуса таймера (чтобы править его и после рестарта)"""
+    _add_column_if_missing(cursor, "active_timers", "status_chat_id", "INTEGER")
+    _add_column_if_missing(cursor, "active_timers", "status_message_id", "INTEGER")
+
+
+MIGRATIONS = [
+    (1, _migration_base_schema),
+    (2, _migration_task_indexes),
+    (3, _migration_active_timers),
+    (4, _migration_aggregates),
+    (5, _migration_broadcasts),
+    (6, _migration_user_reachability),
+    (7, _migration_fsm_states),
+    (8, _migration_task_catalog),
+    (9, _migration_task_report_index),
+    (10, _migration_timer_status_message),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Применяет недостающие миграции и возвращает итоговую версию схемы"""
+    cursor = conn.cursor()
+    for version, migration in MIGRATIONS:
+        # BEGIN IMMEDIATE сериализует миграции нескольких процессов
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            current = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if current >= version:
+                cursor.execute("COMMIT")
+                continue
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {version}")
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        print(f"Миграция БД {version} применена: {migration.__doc__}")
+
+    return cursor.execute("PRAGMA user_version").fetchone()[0]
+
+
+# ================== СХЕМА ==================
+def init_db():
+    """Ваша функция создания базы: применяет миграции и открывает пул соединений"""
+    global _pool
+
+    conn = sqlite3.connect(
+        str(DB_PATH), timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None
+    )
+    version = migrate(conn)
+    conn.close()
+
+    if _pool is None:
+        _pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+    print(f"База данных готова: {DB_PATH} (схема v{version})")
+
+
+# ================== ПОЛЬЗОВАТЕЛИ ==================
+@in_executor
+def log_user(user_id: int, username: str, first_name: str, is_admin: bool = False):
+    """Логирует нового пользователя в таблицу users"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO users (user_id, username, first_name, joined_date, is_admin, is_premium)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                user_id,
+                username or "unknown",
+                first_name or "User",
+                date.today().isoformat(),
+                1 if is_admin else 0,
+                0,
+            ),
+        )
+        # пользователь снова написал боту — значит, он доступен
+        cursor.execute(
+            """
+            UPDATE users SET unreachable_since = NULL, unreachable_reason = NULL
+            WHERE user_id = ? AND unreachable_since IS NOT NULL
+            """,
+            (user_id,),
+        )
+        conn.commit()
+
+
+@in_executor
+def get_statistics(today: date | None = None):
+    """Получает общую статистику по всему боту (из агрегатов, без сканирования tasks)"""
+    today = today or date.today()
+
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute(
+            "SELECT total_users, total_tasks, total_seconds FROM stats_totals WHERE id = 1"
+        )
+        total_users, total_tasks, total_seconds = cursor.fetchone() or (0, 0, 0)
+
+        seven_days_ago = (today - timedelta(days=7)).isoformat()
+        cursor.execute(
+            "SELECT COUNT(DISTINCT user_id) FROM daily_active WHERE date >= ?",
+            (seven_days_ago,),
+        )
+        active_users = cursor.fetchone()[0]
+
+    total_hours = total_seconds / 3600
+    avg_hours = total_hours / total_users if total_users > 0 else 0
+
+    return {
+        "total_users": total_users,
+        "active_users": active_users,
+        "total_tasks": total_tasks,
+        "total_hours": round(total_hours, 1),
+        "avg_hours": round(avg_hours, 1),
+    }
+
+
+@in_executor
+def rebuild_aggregates():
+    """Пересчитывает агрегаты статистики и каталог задач в одной транзакции"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        _rebuild_aggregates(cursor)
+        _rebuild_task_catalog(cursor)
+        conn.commit()
+
+
+def _user_stats_dict(user_info, task_count: int, total_seconds: int, last_date: str | None):
+    total_hours = total_seconds / 3600
+
+    avg_time = total_seconds / task_count if task_count > 0 else 0
+    avg_minutes = avg_time / 60
+
+    last_activity = last_date or "нет активности"
+
+    return {
+        "username": user_info[0] if user_info else "unknown",
+        "first_name": user_info[1] if user_info else "User",
+        "joined_date": user_info[2] if user_info else "unknown",
+        "task_count": task_count,
+        "total_hours": round(total_hours, 1),
+        "avg_minutes": round(avg_minutes, 1),
+        "last_activity": last_activity,
+    }
+
+
+def _get_user_stats(cursor: sqlite3.Cursor, user_id: int):
+    cursor.execute(
+        "SELECT username, first_name, joined_date FROM users WHERE user_id = ?",
+        (user_id,),
+    )
+    user_info = cursor.fetchone()
+
+    cursor.execute(
+        "SELECT task_count, total_seconds, last_date FROM user_totals WHERE user_id = ?",
+        (user_id,),
+    )
+    task_count, total_seconds, last_date = cursor.fetchone() or (0, 0, None)
+
+    return _user_stats_dict(user_info, task_count, total_seconds, last_date)
+
+
+@in_executor
+def get_user_stats(user_id: int):
+    """Получает статистику конкретного пользователя"""
+    with connection() as conn:
+        stats = _get_user_stats(conn.cursor(), user_id)
+    return stats
+
+
+@in_executor
+def get_all_user_ids() -> list[int]:
+    """Список всех доступных user_id (без заблокировавших бота)"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT user_id FROM users WHERE unreachable_since IS NULL ORDER BY user_id"
+        )
+        users = cursor.fetchall()
+    return [user_id for (user_id,) in users]
+
+
+# Пользователи вместе с агрегатами одним запросом (без запроса на каждого)
+_USERS_WITH_TOTALS_SQL = """
+    SELECT u.user_id, u.username, u.first_name, u.joined_date,
+           COALESCE(t.task_count, 0), COALESCE(t.total_seconds, 0), t.last_date
+    FROM users u
+    LEFT JOIN user_totals t ON t.user_id = u.user_id
+"""
+
+
+def _users_with_totals(rows) -> list[dict]:
+    return [
+        {
+            "user_id": user_id,
+            **_user_stats_dict(
+                (username, first_name, joined_date), task_count, total_seconds, last_date
+            ),
+        }
+        for user_id, username, first_name, joined_date, task_count, total_seconds, last_date in rows
+    ]
+
+
+@in_executor
+def get_all_users():
+    """Получает список всех пользователей с их статистикой"""
+    with connection() as conn:
+        cursor = conn.execute(_USERS_WITH_TOTALS_SQL + " ORDER BY u.user_id")
+        return _users_with_totals(cursor)
+
+
+@in_executor
+def count_users() -> int:
+    """Количество зарегистрированных пользователей"""
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+@in_executor
+def get_users_page(after_user_id: int = 0, limit: int = 50) -> tuple[list[dict], bool]:
+    """Страница пользователей со статистикой после after_user_id (keyset-пагинация).
+
+    Возвращает (пользователи, есть_ли_ещё).
+    """
+    with connection() as conn:
+        rows = conn.execute(
+            _USERS_WITH_TOTALS_SQL + " WHERE u.user_id > ? ORDER BY u.user_id LIMIT ?",
+            (after_user_id, limit + 1),
+        ).fetchall()
+    return _users_with_totals(rows[:limit]), len(rows) > limit
+
+
+@in_executor
+def get_non_premium_users(exclude_user_id: int):
+    """Получает список доступных пользователей БЕЗ премиум-статуса"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT user_id FROM users
+            WHERE unreachable_since IS NULL AND is_premium = 0 AND user_id != ?
+            ORDER BY user_id
+            """,
+            (exclude_user_id,),
+        )
+        users = cursor.fetchall()
+    return [user_id for (user_id,) in users]
+
+
+@in_executor
+def _is_premium(user_id: int) -> bool:
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT is_premium FROM users WHERE user_id = ?", (user_id,))
+        result = cursor.fetchone()
+
+    return bool(result and result[0] == 1)
+
+
+async def is_premium(user_id: int) -> bool:
+    """Проверяет, имеет ли пользователь премиум (через кэш)"""
+    if not PREMIUM_CACHE_ENABLED:
+        return await _is_premium(user_id)
+    status = premium_cache.get(user_id)
+    if status is MISSING:
+        generation = premium_cache.generation()
+        status = await _is_premium(user_id)
+        premium_cache.set(user_id, status, generation)
+    return status
+
+
+@in_executor
+def mark_users_unreachable(users: list[tuple[int, str]]):
+    """Отмечает пользователей недоступными: [(user_id, причина), ...]"""
+    now = datetime.now().isoformat(timespec="seconds")
+    with connection() as conn:
+        conn.executemany(
+            """
+            UPDATE users SET unreachable_since = ?, unreachable_reason = ?
+            WHERE user_id = ? AND unreachable_since IS NULL
+            """,
+            ((now, reason, user_id) for user_id, reason in users),
+        )
+        conn.commit()
+
+
+@in_executor
+def count_unreachable_users() -> int:
+    """Сколько пользователей отмечены недоступными"""
+    with connection() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM users WHERE unreachable_since IS NOT NULL"
+        ).fetchone()[0]
+
+
+@in_executor
+def _set_premium_status(user_id: int, status: int) -> bool:
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE users SET is_premium = ? WHERE user_id = ?",
+            (1 if status else 0, user_id),
+        )
+        conn.commit()
+        updated = cursor.rowcount > 0
+    return updated
+
+
+async def set_premium_status(user_id: int, status: int) -> bool:
+    """Устанавливает премиум-статус пользователю (0/1)"""
+    try:
+        return await _set_premium_status(user_id, status)
+    finally:
+        premium_cache.invalidate(user_id)
+
+
+# ================== ЧАСОВЫЕ ПОЯСА ==================
+@in_executor
+def _get_user_timezone(user_id: int) -> str | None:
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT timezone FROM user_timezones WHERE user_id = ?",
+            (user_id,),
+        )
+        result = cursor.fetchone()
+
+    return result[0] if result else None
+
+
+async def get_user_timezone(user_id: int) -> str | None:
+    """Получает название часового пояса пользователя (через кэш)"""
+    tz_name = timezone_cache.get(user_id)
+    if tz_name is MISSING:
+        generation = timezone_cache.generation()
+        tz_name = await _get_user_timezone(user_id)
+        timezone_cache.set(user_id, tz_name, generation)
+    return tz_name
+
+
+@in_executor
+def _save_user_timezone(user_id: int, timezone_str: str):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO user_timezones (user_id, timezone) VALUES (?, ?)",
+            (user_id, timezone_str),
+        )
+        conn.commit()
+
+
+async def save_user_timezone(user_id: int, timezone_str: str):
+    """Сохраняет часовой пояс пользователя в БД"""
+    try:
+        await _save_user_timezone(user_id, timezone_str)
+    finally:
+        timezone_cache.invalidate(user_id)
+
+
+# ================== ЗАДАЧИ ==================
+def _update_task_catalog(
+    cursor: sqlite3.Cursor, user_id: int, task_number: str, duration: int, date_str: str, time_start: str
+):
+    """Учитывает новую запись в каталоге задач (в транзакции вставки)"""
+    cursor.execute(
+        """
+        INSERT INTO task_catalog (user_id, name, last_used, usage_count, total_seconds)
+        VALUES (?, ?, ?, 1, ?)
+        ON CONFLICT (user_id, name) DO UPDATE SET
+            last_used = MAX(last_used, excluded.last_used),
+            usage_count = usage_count + 1,
+            total_seconds = total_seconds + excluded.total_seconds
+        """,
+        (user_id, task_number, f"{date_str} {time_start}", duration),
+    )
+
+
+def _update_aggregates(cursor: sqlite3.Cursor, user_id: int, duration: int, date_str: str):
+    """Учитывает новую задачу в агрегатах (в транзакции вставки)"""
+    cursor.execute(
+        "INSERT OR IGNORE INTO user_totals (user_id, task_count, total_seconds) VALUES (?, 0, 0)",
+        (user_id,),
+    )
+    new_user = cursor.rowcount == 1
+    cursor.execute(
+        """
+        UPDATE user_totals
+        SET task_count = task_count + 1,
+            total_seconds = total_seconds + ?,
+            last_date = MAX(COALESCE(last_date, ''), ?)
+        WHERE user_id = ?
+        """,
+        (duration, date_str, user_id),
+    )
+    cursor.execute(
+        "INSERT OR IGNORE INTO daily_active (date, user_id) VALUES (?, ?)",
+        (date_str, user_id),
+    )
+    cursor.execute(
+        """
+        INSERT INTO stats_totals (id, total_users, total_tasks, total_seconds)
+        VALUES (1, ?, 1, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            total_users = total_users + excluded.total_users,
+            total_tasks = total_tasks + 1,
+            total_seconds = total_seconds + excluded.total_seconds
+        """,
+        (1 if new_user else 0, duration),
+    )
+
+
+def _insert_task(
+    cursor: sqlite3.Cursor, user_id: int, task_number: str, duration: int, date_str: str, time_start: str
+) -> int:
+    """Вставляет задачу и обновляет агрегаты и каталог (в транзакции вызывающего)"""
+    cursor.execute(
+        """
+        INSERT INTO tasks (user_id, task_number, duration, date, time_start, description)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (user_id, task_number, duration, date_str, time_start, None),
+    )
+    task_id = cursor.lastrowid
+    _update_aggregates(cursor, user_id, duration, date_str)
+    _update_task_catalog(cursor, user_id, task_number, duration, date_str, time_start)
+    return task_id
+
+
+@batched_write
+def add_task(
+    cursor: sqlite3.Cursor, user_id: int, task_number: str, duration: int, date_str: str, time_start: str
+) -> int:
+    """Сохраняет завершённую задачу и возвращает её id"""
+    return _insert_task(cursor, user_id, task_number, duration, date_str, time_start)
+
+
+@batched_write
+def set_task_description(
+    cursor: sqlite3.Cursor, user_id: int, task_id: int, description: str
+) -> tuple[str, str] | None:
+    """Сохраняет описание трудозатрат для задачи; возвращает её (дату, название)"""
+    # fetchall дочитывает RETURNING до конца, иначе оператор остаётся незавершённым
+    rows = cursor.execute(
+        "UPDATE tasks SET description = ? WHERE id = ? AND user_id = ? RETURNING date, task_number",
+        (description, task_id, user_id),
+    ).fetchall()
+    return rows[0] if rows else None
+
+
+@in_executor
+def get_day_totals(user_id: int, date_str: str) -> tuple[int, int]:
+    """Итог дня: (секунды, записей)"""
+    with connection() as conn:
+        seconds, count = conn.execute(
+            "SELECT COALESCE(SUM(duration), 0), COUNT(*) FROM tasks WHERE user_id = ? AND date = ?",
+            (user_id, date_str),
+        ).fetchone()
+    return seconds, count
+
+
+@in_executor
+def get_active_days(user_id: int, year: int, month: int) -> set[int]:
+    """Дни месяца, в которые у пользователя есть записи"""
+    month_start = date(year, month, 1).isoformat()
+    month_end = f"{year:04d}-{month:02d}-31"
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT date FROM tasks WHERE user_id = ? AND date BETWEEN ? AND ?",
+            (user_id, month_start, month_end),
+        ).fetchall()
+    return {int(day[8:10]) for (day,) in rows}
+
+
+@in_executor
+def get_tasks_for_date_page(
+    user_id: int, date_str: str, after: tuple[str, int] | None = None, limit: int = 50
+) -> tuple[list[tuple], bool]:
+    """Задачи за день после after=(time_start, id): [(id, task_number, duration, time_start, description)].
+
+    Возвращает (записи, есть_ли_ещё).
+    """
+    after_time, after_id = after or ("", 0)
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT id, task_number, duration, time_start, description
+            FROM tasks
+            WHERE user_id = ? AND date = ? AND (time_start, id) > (?, ?)
+            ORDER BY time_start, id
+            LIMIT ?
+            """,
+            (user_id, date_str, after_time, after_id, limit + 1),
+        ).fetchall()
+    return rows[:limit], len(rows) > limit
+
+
+@in_executor
+def get_tasks_for_task_page(
+    user_id: int, task_number: str, after: tuple[str, str, int] | None = None, limit: int = 50
+) -> tuple[list[tuple], bool]:
+    """Записи по задаче после after=(date, time_start, id): [(id, date, duration, time_start, description)].
+
+    Возвращает (записи, есть_ли_ещё).
+    """
+    after_date, after_time, after_id = after or ("", "", 0)
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT id, date, duration, time_start, description
+            FROM tasks
+            WHERE user_id = ? AND task_number = ? AND (date, time_start, id) > (?, ?, ?)
+            ORDER BY date, time_start, id
+            LIMIT ?
+            """,
+            (user_id, task_number, after_date, after_time, after_id, limit + 1),
+        ).fetchall()
+    return rows[:limit], len(rows) > limit
+
+
+@in_executor
+def get_task_day_totals(
+    user_id: int, task_number: str, date_from: str = "", date_to: str = "9999-12-31"
+) -> dict[str, int]:
+    """Итоги задачи по дням в диапазоне: {date: секунды}"""
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT date, SUM(duration)
+            FROM tasks
+            WHERE user_id = ? AND task_number = ? AND date BETWEEN ? AND ?
+            GROUP BY date
+            """,
+            (user_id, task_number, date_from, date_to),
+        ).fetchall()
+    return dict(rows)
+
+
+# Периоды длиннее стольких дней сводятся по месяцам, а не по дням
+RANGE_DAILY_MAX_DAYS = 31
+
+
+@in_executor
+def get_range_summary(user_id: int, date_from: str, date_to: str) -> dict:
+    """Сводка за период [date_from, date_to]: итоги по дням (или месяцам) и по задачам.
+
+    Оба запроса агрегируют в SQLite по индексу (user_id, date, ...).
+    """
+    days = (date.fromisoformat(date_to) - date.fromisoformat(date_from)).days + 1
+    period = "date" if days <= RANGE_DAILY_MAX_DAYS else "substr(date, 1, 7)"
+    with connection() as conn:
+        periods = conn.execute(
+            f"""
+            SELECT {period} AS period, SUM(duration), COUNT(*)
+            FROM tasks
+            WHERE user_id = ? AND date BETWEEN ? AND ?
+            GROUP BY period
+            ORDER BY period
+            """,
+            (user_id, date_from, date_to),
+        ).fetchall()
+        tasks = conn.execute(
+            """
+            SELECT task_number, SUM(duration) AS seconds, COUNT(*)
+            FROM tasks
+            WHERE user_id = ? AND date BETWEEN ? AND ?
+            GROUP BY task_number
+            ORDER BY seconds DESC, task_number
+            """,
+            (user_id, date_from, date_to),
+        ).fetchall()
+
+    return {
+        "by_month": period != "date",
+        "periods": periods,
+        "tasks": tasks,
+        "total_seconds": sum(seconds for _, seconds, _ in periods),
+        "total_count": sum(count for _, _, count in periods),
+    }
+
+
+_CATALOG_COLUMNS = "id, name, usage_count, total_seconds"
+
+
+def _catalog_dicts(rows) -> list[dict]:
+    return [
+        {"id": task_id, "name": name, "usage_count": usage_count, "total_seconds": total_seconds}
+        for task_id, name, usage_count, total_seconds in rows
+    ]
+
+
+@in_executor
+def get_task_catalog_page(user_id: int, offset: int = 0, limit: int = 10) -> tuple[list[dict], bool]:
+    """Страница каталога задач от недавних к старым.
+
+    Возвращает (задачи, есть_ли_ещё).
+    """
+    with connection() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT {_CATALOG_COLUMNS} FROM task_catalog
+            WHERE user_id = ?
+            ORDER BY last_used DESC, id DESC
+            LIMIT ? OFFSET ?
+            """,
+            (user_id, limit + 1, offset),
+        ).fetchall()
+    return _catalog_dicts(rows[:limit]), len(rows) > limit
+
+
+@in_executor
+def search_task_catalog(user_id: int, query: str, limit: int = 20) -> list[dict]:
+    """Задачи пользователя, в названии которых есть query (без учёта регистра)"""
+    with connection() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT {_CATALOG_COLUMNS} FROM task_catalog
+            WHERE user_id = ? AND instr(casefold(name), ?) > 0
+            ORDER BY last_used DESC, id DESC
+            LIMIT ?
+            """,
+            (user_id, query.casefold(), limit),
+        ).fetchall()
+    return _catalog_dicts(rows)
+
+
+@in_executor
+def get_catalog_task(user_id: int, name: str) -> dict | None:
+    """Задача из каталога по названию: id и итоги"""
+    with connection() as conn:
+        rows = conn.execute(
+            f"SELECT {_CATALOG_COLUMNS} FROM task_catalog WHERE user_id = ? AND name = ?",
+            (user_id, name),
+        ).fetchall()
+    return _catalog_dicts(rows)[0] if rows else None
+
+
+@in_executor
+def get_catalog_task_name(user_id: int, catalog_id: int) -> str | None:
+    """Название задачи из каталога по её короткому id"""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT name FROM task_catalog WHERE id = ? AND user_id = ?",
+            (catalog_id, user_id),
+        ).fetchone()
+    return row[0] if row else None
+
+
+# Сколько строк читается из курсора за раз при экспорте
+CSV_BATCH = 500
+
+CSV_HEADERS = [
+    "№ по порядку",
+    "Дата задачи",
+    "Наименование задачи",
+    "Время начала",
+    "Время окончания",
+    "Всего затраченное время",
+    "Содержание работ",
+]
+
+
+def _csv_row(idx: int, task_number: str, task_date: str, time_start: str, duration: int, description):
+    # time_start в БД = фактическое время окончания
+    end_time = datetime.strptime(time_start, "%H:%M")
+    duration_td = timedelta(seconds=duration)
+    start_time = end_time - duration_td
+
+    hours, remainder = divmod(duration, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    duration_str = f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}"
+
+    return [
+        idx,
+        task_date,
+        task_number,
+        start_time.strftime("%H:%M"),  # реальное время начала
+        end_time.strftime("%H:%M"),    # реальное время окончания
+        duration_str,
+        description or "",
+    ]
+
+
+@in_executor
+def generate_csv_report(
+    user_id: int, date_from: str | None = None, date_to: str | None = None
+) -> tuple[Path, int]:
+    """Генерирует CSV файл с отчетом по задачам во временном файле на диске.
+
+    Строки читаются из курсора порциями и сразу пишутся в файл, поэтому
+    вся история в памяти не держится. Возвращает (путь к файлу, число записей);
+    удалить файл должен вызывающий.
+    """
+    query = """
+        SELECT task_number, date, time_start, duration, description
+        FROM tasks
+        WHERE user_id = ?
+    """
+    params: list = [user_id]
+    if date_from:
+        query += " AND date >= ?"
+        params.append(date_from)
+    if date_to:
+        query += " AND date <= ?"
+        params.append(date_to)
+    query += " ORDER BY date DESC, time_start DESC"
+
+    output = tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8-sig", newline="", suffix=".csv", delete=False
+    )
+    count = 0
+    try:
+        with output, connection() as conn:
+            writer = csv.writer(output, lineterminator="\n")
+            writer.writerow(CSV_HEADERS)
+
+            cursor = conn.execute(query, params)
+            while rows := cursor.fetchmany(CSV_BATCH):
+                writer.writerows(_csv_row(count + idx, *row) for idx, row in enumerate(rows, 1))
+                count += len(rows)
+    except BaseException:
+        os.unlink(output.name)
+        raise
+
+    return Path(output.name), count
+
+
+# ================== АКТИВНЫЕ ТАЙМЕРЫ ==================
+# Таймер: {"start_time": float, "task_number": str, "date": str}
+@batched_write
+def finish_timer(
+    cursor: sqlite3.Cursor, user_id: int, finished_at: float, time_start: str
+) -> tuple[dict, int] | None:
+    """Снимает таймер и записывает задачу в одной транзакции (None, если таймер не запущен)"""
+    rows = cursor.execute(
+        """
+        DELETE FROM active_timers WHERE user_id = ?
+        RETURNING start_time, task_number, date
+        """,
+        (user_id,),
+    ).fetchall()
+    if not rows:
+        return None
+    start_time, task_number, date_str = rows[0]
+    task_id = _insert_task(
+        cursor, user_id, task_number, int(finished_at - start_time), date_str, time_start
+    )
+    return {"start_time": start_time, "task_number": task_number, "date": date_str}, task_id
+
+
+class SQLiteTimerStore:
+    """Таймеры в таблице active_timers: переживают рестарт и видны всем процессам"""
+
+    @in_executor
+    def get(self, user_id: int) -> dict | None:
+        with connection() as conn:
+            row = conn.execute(
+                "SELECT start_time, task_number, date FROM active_timers WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+        if not row:
+            return None
+        return {"start_time": row[0], "task_number": row[1], "date": row[2]}
+
+    @in_executor
+    def start(self, user_id: int, task_number: str, start_time: float, date_str: str) -> bool:
+        """Запускает таймер, только если он ещё не запущен (compare-and-set)"""
+        with connection() as conn:
+            cursor = conn.execute(
+                """
+                INSERT OR IGNORE INTO active_timers (user_id, task_number, start_time, date)
+                VALUES (?, ?, ?, ?)
+                """,
+                (user_id, task_number, start_time, date_str),
+            )
+            conn.commit()
+            return cursor.rowcount == 1
+
+    async def finish(self, user_id: int, finished_at: float, time_start: str) -> tuple[dict, int] | None:
+        """Снимает таймер и сохраняет задачу одной транзакцией: (таймер, id задачи)"""
+        return await finish_timer(user_id, finished_at, time_start)
+
+    @in_executor
+    def set_status_message(self, user_id: int, chat_id: int, message_id: int):
+        """Запоминает сообщение живого статуса запущенного таймера"""
+        with connection() as conn:
+            conn.execute(
+                "UPDATE active_timers SET status_chat_id = ?, status_message_id = ? WHERE user_id = ?",
+                (chat_id, message_id, user_id),
+            )
+            conn.commit()
+
+    @in_executor
+    def all(self) -> dict[int, dict]:
+        """Все запущенные таймеры (для восстановления при старте)"""
+        with connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT user_id, start_time, task_number, date, status_chat_id, status_message_id
+                FROM active_timers
+                """
+            ).fetchall()
+        return {
+            user_id: {
+                "start_time": start_time,
+                "task_number": task_number,
+                "date": date_str,
+                "status_chat_id": status_chat_id,
+                "status_message_id": status_message_id,
+            }
+            for user_id, start_time, task_number, date_str, status_chat_id, status_message_id in rows
+        }
+
+
+class MemoryTimerStore:
+    """Таймеры в памяти процесса (для тестов и одиночного запуска)"""
+
+    def __init__(self):
+        self._timers: dict[int, dict] = {}
+
+    async def get(self, user_id: int) -> dict | None:
+        return self._timers.get(user_id)
+
+    async def start(self, user_id: int, task_number: str, start_time: float, date_str: str) -> bool:
+        if user_id in self._timers:
+            return False
+        self._timers[user_id] = {
+            "start_time": start_time,
+            "task_number": task_number,
+            "date": date_str,
+        }
+        return True
+
+    async def finish(self, user_id: int, finished_at: float, time_start: str) -> tuple[dict, int] | None:
+        timer = self._timers.pop(user_id, None)
+        if timer is None:
+            return None
+        try:
+            task_id = await add_task(
+                user_id, timer["task_number"], int(finished_at - timer["start_time"]), timer["date"], time_start
+            )
+        except Exception:
+            # задача не сохранилась — таймер возвращается, его можно остановить ещё раз
+            self._timers.setdefault(user_id, timer)
+            raise
+        return timer, task_id
+
+    async def set_status_message(self, user_id: int, chat_id: int, message_id: int):
+        timer = self._timers.get(user_id)
+        if timer:
+            timer["status_chat_id"] = chat_id
+            timer["status_message_id"] = message_id
+
+    async def all(self) -> dict[int, dict]:
+        return dict(self._timers)
+
+
+def create_timer_store(kind: str = TIMER_STORE):
+    """Создаёт хранилище таймеров по названию из TIMER_STORE"""
+    if kind == "memory":
+        return MemoryTimerStore()
+    if kind == "sqlite":
+        return SQLiteTimerStore()
+    raise ValueError(f"Неизвестное хранилище таймеров: {kind}")
+
+
+# ================== РАССЫЛКИ ==================
+# Статусы рассылки: running, paused, cancelled, done
+# Статусы получателя: pending, sent, failed, unreachable
+@in_executor
+def create_broadcast(
+    admin_chat_id: int, kind: str, text: str | None, photo_id: str | None, user_ids: list[int]
+) -> int:
+    """Создаёт рассылку со списком получателей и возвращает её id"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO broadcast_jobs (created_at, admin_chat_id, kind, text, photo_id)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (datetime.now().isoformat(timespec="seconds"), admin_chat_id, kind, text, photo_id),
+        )
+        job_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT OR IGNORE INTO broadcast_recipients (job_id, user_id) VALUES (?, ?)",
+            ((job_id, user_id) for user_id in user_ids),
+        )
+        conn.commit()
+    return job_id
+
+
+def _broadcast_from_row(cursor: sqlite3.Cursor, row) -> dict:
+    job_id, created_at, admin_chat_id, kind, text, photo_id, status = row
+    counts = dict(
+        cursor.execute(
+            "SELECT status, COUNT(*) FROM broadcast_recipients WHERE job_id = ? GROUP BY status",
+            (job_id,),
+        ).fetchall()
+    )
+    return {
+        "id": job_id,
+        "created_at": created_at,
+        "admin_chat_id": admin_chat_id,
+        "kind": kind,
+        "text": text,
+        "photo_id": photo_id,
+        "status": status,
+        "total": sum(counts.values()),
+        "pending": counts.get("pending", 0),
+        "sent": counts.get("sent", 0),
+        "failed": counts.get("failed", 0),
+        "unreachable": counts.get("unreachable", 0),
+    }
+
+
+_BROADCAST_COLUMNS = "id, created_at, admin_chat_id, kind, text, photo_id, status"
+
+
+@in_executor
+def get_broadcast(job_id: int) -> dict | None:
+    """Рассылка с прогрессом доставки"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        row = cursor.execute(
+            f"SELECT {_BROADCAST_COLUMNS} FROM broadcast_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return _broadcast_from_row(cursor, row) if row else None
+
+
+@in_executor
+def get_recent_broadcasts(limit: int = 5) -> list[dict]:
+    """Последние рассылки с прогрессом"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        rows = cursor.execute(
+            f"SELECT {_BROADCAST_COLUMNS} FROM broadcast_jobs ORDER BY id DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [_broadcast_from_row(cursor, row) for row in rows]
+
+
+@in_executor
+def get_broadcast_ids(status: str) -> list[int]:
+    """id рассылок в указанном статусе"""
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT id FROM broadcast_jobs WHERE status = ? ORDER BY id", (status,)
+        ).fetchall()
+    return [job_id for (job_id,) in rows]
+
+
+@in_executor
+def set_broadcast_status(job_id: int, status: str) -> bool:
+    """Меняет статус незавершённой рассылки; завершённую или отменённую не трогает"""
+    with connection() as conn:
+        cursor = conn.execute(
+            "UPDATE broadcast_jobs SET status = ? WHERE id = ? AND status IN ('running', 'paused')",
+            (status, job_id),
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+
+
+@in_executor
+def get_pending_recipients(job_id: int, after_user_id: int, limit: int) -> list[int]:
+    """Следующая порция недоставленных получателей (keyset по user_id)"""
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT user_id FROM broadcast_recipients
+            WHERE job_id = ? AND status = 'pending' AND user_id > ?
+            ORDER BY user_id
+            LIMIT ?
+            """,
+            (job_id, after_user_id, limit),
+        ).fetchall()
+    return [user_id for (user_id,) in rows]
+
+
+@in_executor
+def mark_recipients(results: list[tuple[int, int, str, str | None]]):
+    """Записывает результаты доставки: [(job_id, user_id, status, error), ...]"""
+    with connection() as conn:
+        conn.executemany(
+            "UPDATE broadcast_recipients SET status = ?, error = ? WHERE job_id = ? AND user_id = ?",
+            ((status, error, job_id, user_id) for job_id, user_id, status, error in results),
+        )
+        conn.commit()
+
+
+# ================== FSM-СОСТОЯНИЯ ==================
+@in_executor
+def fsm_load(key: str) -> tuple[str | None, str | None, float] | None:
+    """(state, data в JSON, updated_at) по ключу или None"""
+    with connection() as conn:
+        return conn.execute(
+            "SELECT state, data, updated_at FROM fsm_states WHERE key = ?", (key,)
+        ).fetchone()
+
+
+@in_executor
+def fsm_save(upserts: list[tuple[str, str | None, str, float]], deletes: list[str]):
+    """Пачка изменений одной транзакцией: [(key, state, data, updated_at)] и ключи на удаление"""
+    with connection() as conn:
+        conn.executemany(
+            """
+            INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+            """,
+            upserts,
+        )
+        conn.executemany("DELETE FROM fsm_states WHERE key = ?", ((key,) for key in deletes))
+        conn.commit()
+
+
+@in_executor
+def fsm_expire(before: float) -> int:
+    """Удаляет состояния, не менявшиеся с момента before (unix time)"""
+    with connection() as conn:
+        cursor = conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (before,))
+        conn.commit()
+        return cursor.rowcount
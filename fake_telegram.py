@@ -0,0 +1,344 @@
+"""Локальный фейковый Bot API для офлайн-замеров бота.
+
+Сервер отвечает на методы Bot API, которыми пользуется timebot.py, отдаёт
+апдейты через getUpdates (polling) или отправляет их POST-запросом на
+зарегистрированный webhook. Виртуальные пользователи работают по замкнутому
+циклу: отправляют апдейт и ждут ответа бота, поэтому задержка считается
+от апдейта до ответа.
+
+Сравнение режимов:
+    python fake_telegram.py --users 50 --rounds 10
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from aiohttp import ClientSession, web
+
+FAKE_TOKEN = "42:fake-token"
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "TimeBot", "username": "fake_timebot"}
+
+# Методы, которые отвечают сообщением
+MESSAGE_METHODS = {"sendMessage", "sendPhoto", "sendDocument", "sendInvoice", "editMessageText"}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль q (0..100) по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class FakeTelegram:
+    """Фейковый сервер Bot API с виртуальными пользователями"""
+
+    def __init__(self, token: str = FAKE_TOKEN):
+        self.token = token
+        self.updates: list[dict] = []
+        self.webhook_url = ""
+        self.webhook_secret = ""
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+        self._new_update = asyncio.Condition()
+        self._waiters: dict[int, tuple[int, list, asyncio.Future]] = {}
+        self._client: ClientSession | None = None
+        self._runner: web.AppRunner | None = None
+
+        # статистика
+        self.calls: dict[str, int] = {}
+        self.webhook_retries = 0
+
+    # ---------- сервер ----------
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081):
+        self._client = ClientSession()
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._client:
+            await self._client.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        if request.match_info["token"] != self.token:
+            return web.json_response(
+                {"ok": False, "error_code": 401, "description": "Unauthorized"}, status=401
+            )
+
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        handler = getattr(self, f"api_{method}", None)
+        result = await handler(params) if handler else True
+        if method in MESSAGE_METHODS or method in ("editMessageReplyMarkup", "deleteMessage"):
+            self._on_bot_reply(int(params.get("chat_id", 0)), method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, chat_id: int, **extra) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            **extra,
+        }
+
+    async def api_getMe(self, params):
+        return BOT_USER
+
+    async def api_getUpdates(self, params):
+        offset = int(params.get("offset", 0))
+        timeout = float(params.get("timeout", 0))
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates and timeout:
+            async with self._new_update:
+                try:
+                    await asyncio.wait_for(
+                        self._new_update.wait_for(lambda: self.updates), timeout
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        limit = int(params.get("limit", 100))
+        return self.updates[:limit]
+
+    async def api_setWebhook(self, params):
+        self.webhook_url = params.get("url", "")
+        self.webhook_secret = params.get("secret_token", "")
+        return True
+
+    async def api_deleteWebhook(self, params):
+        self.webhook_url = ""
+        return True
+
+    async def api_sendMessage(self, params):
+        return self._message(int(params["chat_id"]), text=params.get("text", ""))
+
+    async def api_editMessageText(self, params):
+        return self._message(int(params["chat_id"]), text=params.get("text", ""))
+
+    async def api_sendPhoto(self, params):
+        photo = {"file_id": "photo", "file_unique_id": "photo", "width": 1, "height": 1}
+        return self._message(int(params["chat_id"]), photo=[photo])
+
+    async def api_sendDocument(self, params):
+        document = {"file_id": "document", "file_unique_id": "document"}
+        return self._message(int(params["chat_id"]), document=document)
+
+    async def api_sendInvoice(self, params):
+        invoice = {
+            "title": params.get("title", ""),
+            "description": params.get("description", ""),
+            "start_parameter": "",
+            "currency": params.get("currency", "RUB"),
+            "total_amount": 0,
+        }
+        return self._message(int(params["chat_id"]), invoice=invoice)
+
+    # ---------- виртуальные пользователи ----------
+    def _on_bot_reply(self, chat_id: int, method: str, params: dict):
+        waiter = self._waiters.get(chat_id)
+        if not waiter:
+            return
+        expected, replies, future = waiter
+        replies.append((method, params))
+        if len(replies) >= expected and not future.done():
+            future.set_result(replies)
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+    def message_update(self, user_id: int, text: str) -> dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def callback_update(self, user_id: int, data: str) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._callback_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": self._message(user_id, text="…"),
+            },
+        }
+
+    async def deliver(self, update: dict):
+        """Передаёт апдейт боту: в очередь getUpdates или POST на webhook"""
+        if not self.webhook_url:
+            self.updates.append(update)
+            async with self._new_update:
+                self._new_update.notify_all()
+            return
+
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+        while True:
+            async with self._client.post(self.webhook_url, json=update, headers=headers) as response:
+                if response.status < 400:
+                    return
+                if response.status not in (429, 503):
+                    raise RuntimeError(f"webhook ответил {response.status}")
+            # как Telegram: повторяем доставку позже
+            self.webhook_retries += 1
+            await asyncio.sleep(0.05)
+
+    async def ask(self, user_id: int, update: dict, expected: int = 1, timeout: float = 30) -> tuple[float, list]:
+        """Отправляет апдейт от пользователя и ждёт expected ответов бота.
+
+        Возвращает (задержка в секундах, список (метод, параметры)).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[user_id] = (expected, [], future)
+        started = time.perf_counter()
+        try:
+            await self.deliver(update)
+            replies = await asyncio.wait_for(future, timeout)
+        finally:
+            self._waiters.pop(user_id, None)
+        return time.perf_counter() - started, replies
+
+
+# ================== СРАВНЕНИЕ POLLING И WEBHOOK ==================
+# Один цикл работы пользователя: (текст, сколько сообщений ответит бот)
+TIMER_CYCLE = [
+    ("⏰ Начать", 1),
+    ("Задача {n}", 1),
+    ("⏹️ Стоп", 2),
+    ("❌ Нет", 1),
+    ("📊 Отчет за сегодня", 1),
+]
+
+
+async def run_users(fake: FakeTelegram, users: int, rounds: int, first_user_id: int = 1000) -> dict:
+    """Гоняет users виртуальных пользователей по TIMER_CYCLE rounds раз"""
+    latencies: list[float] = []
+
+    async def user(user_id: int):
+        for n in range(rounds):
+            for text, expected in TIMER_CYCLE:
+                update = fake.message_update(user_id, text.format(n=n))
+                latency, _ = await fake.ask(user_id, update, expected)
+                latencies.append(latency)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(first_user_id + i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "updates": len(latencies),
+        "seconds": round(elapsed, 2),
+        "updates_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+def configure_bot_env(api_port: int, webhook_port: int, data_dir: str | None = None):
+    """Переменные окружения, чтобы timebot ходил в фейковый сервер (до импорта timebot)"""
+    os.environ.setdefault("DATA_DIR", data_dir or tempfile.mkdtemp(prefix="timebot-bench-"))
+    os.environ["TELEGRAM_BOT_TOKEN"] = FAKE_TOKEN
+    os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{api_port}"
+    os.environ["WEBHOOK_SECRET"] = "bench-secret"
+    os.environ["WEBAPP_PORT"] = str(webhook_port)
+    # виртуальные пользователи шлют апдейты быстрее людей — лимит на пользователя снимаем
+    os.environ.setdefault("THROTTLE_RATE", "0")
+
+
+@contextlib.asynccontextmanager
+async def running_bot(fake: FakeTelegram, timebot, mode: str, webhook_port: int):
+    """Запускает бота в режиме mode на время блока и останавливает его"""
+    stop_event = asyncio.Event()
+    if mode == "webhook":
+        from webhook import WebhookServer
+
+        server = WebhookServer(timebot.dp, timebot.bot)
+        bot_task = asyncio.create_task(
+            server.serve("127.0.0.1", webhook_port, f"http://127.0.0.1:{webhook_port}", stop_event)
+        )
+        while not fake.webhook_url:
+            await asyncio.sleep(0.01)
+    else:
+        await fake.api_deleteWebhook({})
+        bot_task = asyncio.create_task(
+            timebot.dp.start_polling(timebot.bot, handle_signals=False, polling_timeout=10)
+        )
+
+    try:
+        yield
+    finally:
+        if mode == "webhook":
+            stop_event.set()
+            await fake.api_deleteWebhook({})
+        else:
+            await timebot.dp.stop_polling()
+        await bot_task
+
+
+async def run_mode(fake: FakeTelegram, timebot, mode: str, users: int, rounds: int, webhook_port: int) -> dict:
+    """Запускает бота в режиме mode, прогоняет нагрузку и останавливает бота"""
+    async with running_bot(fake, timebot, mode, webhook_port):
+        # у каждого режима свои пользователи, чтобы таймеры не пересекались
+        first_user_id = 1000 if mode == "polling" else 1_000_000
+        return await run_users(fake, users, rounds, first_user_id)
+
+
+async def compare(users: int, rounds: int, modes: list[str], api_port: int, webhook_port: int):
+    configure_bot_env(api_port, webhook_port)
+    fake = FakeTelegram()
+    await fake.start(port=api_port)
+
+    import timebot
+
+    results = {}
+    try:
+        for mode in modes:
+            results[mode] = await run_mode(fake, timebot, mode, users, rounds, webhook_port)
+            print(f"{mode}: {json.dumps(results[mode], ensure_ascii=False)}")
+    finally:
+        await fake.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение polling и webhook на фейковом Bot API")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--mode", choices=["polling", "webhook", "both"], default="both")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8082)
+    args = parser.parse_args()
+
+    modes = ["polling", "webhook"] if args.mode == "both" else [args.mode]
+    asyncio.run(compare(args.users, args.rounds, modes, args.api_port, args.webhook_port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Mapping
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import db
+
+# ================== НАСТРОЙКИ FSM ==================
+# Хранилище FSM-состояний: sqlite (по умолчанию, переживает перезапуск) или memory
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+# Как часто накопленные изменения состояний пишутся в БД (секунды)
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0.5"))
+# Через сколько секунд без действий состояние считается брошенным и удаляется
+FSM_TTL = float(os.getenv("FSM_TTL", str(7 * 24 * 3600)))
+# Сколько секунд чистая запись живёт в памяти после последнего обращения
+FSM_CACHE_IDLE = float(os.getenv("FSM_CACHE_IDLE", "900"))
+# Как часто удалять брошенные состояния из БД (секунды)
+FSM_EXPIRE_INTERVAL = 600
+
+
+class _Record:
+    __slots__ = ("state", "data", "updated_at", "touched")
+
+    def __init__(self, state: str | None = None, data: dict | None = None, updated_at: float = 0.0):
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at
+        self.touched = time.monotonic()
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в tasks.db с чтением через память и отложенной записью.
+
+    Изменения состояний копятся в памяти и раз в FSM_FLUSH_INTERVAL пишутся
+    в БД одной транзакцией. Память — источник истины для процесса, поэтому
+    хранилище рассчитано на одиночный процесс или шарды по user_id.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+        ttl: float = FSM_TTL,
+        cache_idle: float = FSM_CACHE_IDLE,
+    ):
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.cache_idle = cache_idle
+        self._records: dict[str, _Record] = {}
+        self._dirty: set[str] = set()
+        self._loading: dict[str, asyncio.Future] = {}
+        self._flusher: asyncio.Task | None = None
+        self._last_expire = 0.0
+
+        # статистика
+        self.flushes = 0
+        self.rows_written = 0
+        self.loads = 0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return (
+            f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:"
+            f"{key.business_connection_id or ''}:{key.destiny}"
+        )
+
+    def _expired(self, record: _Record) -> bool:
+        return bool(record.updated_at) and record.updated_at < time.time() - self.ttl
+
+    async def _record(self, key: StorageKey) -> _Record:
+        """Запись из памяти; при промахе читается из БД (один запрос на ключ)"""
+        skey = self._key(key)
+        record = self._records.get(skey)
+        if record is None:
+            loading = self._loading.get(skey)
+            if loading is None:
+                loading = asyncio.get_running_loop().create_future()
+                self._loading[skey] = loading
+                try:
+                    row = await db.fsm_load(skey)
+                    self.loads += 1
+                    record = self._records.get(skey)
+                    if record is None:
+                        record = _Record()
+                        if row:
+                            state, data, updated_at = row
+                            record = _Record(state, json.loads(data) if data else {}, updated_at)
+                        self._records[skey] = record
+                    loading.set_result(record)
+                except BaseException as e:
+                    loading.set_exception(e)
+                    raise
+                finally:
+                    self._loading.pop(skey, None)
+            else:
+                record = await asyncio.shield(loading)
+
+        if self._expired(record):
+            record.state, record.data = None, {}
+        record.touched = time.monotonic()
+        return record
+
+    def _mark_dirty(self, key: StorageKey, record: _Record):
+        record.updated_at = time.time()
+        self._dirty.add(self._key(key))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, record)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        record = await self._record(key)
+        record.data = data.copy()
+        self._mark_dirty(key, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return (await self._record(key)).data.copy()
+
+    async def flush(self):
+        """Пишет все накопленные изменения одной транзакцией"""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for skey in keys:
+            record = self._records[skey]
+            if record.state is None and not record.data:
+                deletes.append(skey)
+            else:
+                upserts.append((
+                    skey,
+                    record.state,
+                    json.dumps(record.data, ensure_ascii=False),
+                    record.updated_at,
+                ))
+        try:
+            await db.fsm_save(upserts, deletes)
+        except BaseException:
+            # не потеряем изменения: запишем их в следующий раз
+            self._dirty |= keys
+            raise
+        self.flushes += 1
+        self.rows_written += len(keys)
+
+    def _evict_idle(self):
+        """Убирает из памяти чистые записи, к которым давно не обращались"""
+        border = time.monotonic() - self.cache_idle
+        for skey in [
+            skey for skey, record in self._records.items()
+            if record.touched < border and skey not in self._dirty
+        ]:
+            del self._records[skey]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                self._evict_idle()
+                if time.monotonic() - self._last_expire > FSM_EXPIRE_INTERVAL:
+                    self._last_expire = time.monotonic()
+                    expired = await db.fsm_expire(time.time() - self.ttl)
+                    if expired:
+                        print(f"🧹 Удалено брошенных FSM-состояний: {expired}")
+            except Exception as e:
+                print(f"Ошибка записи FSM-состояний: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._records),
+            "dirty": len(self._dirty),
+            "loads": self.loads,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+    async def close(self) -> None:
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+
+def create_fsm_storage(kind: str = FSM_STORAGE) -> BaseStorage:
+    """Создаёт FSM-хранилище по названию из FSM_STORAGE"""
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "sqlite":
+        return SQLiteStorage()
+    raise ValueError(f"Неизвестное FSM-хранилище: {kind}")
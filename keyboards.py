@@ -0,0 +1,203 @@
+"""Неизменяемые клавиатуры бота: строятся один раз при старте и переиспользуются.
+
+Объекты клавиатур живут всё время работы процесса, а их JSON для Bot API
+считается один раз (при первой отправке) в PrebuiltMarkupSession, поэтому
+ответ с клавиатурой не создаёт новых pydantic-объектов.
+
+Замер на одно сообщение:
+    python keyboards.py
+"""
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    KeyboardButton,
+    ReplyKeyboardMarkup,
+)
+from aiohttp import FormData
+
+
+class KeyboardRegistry:
+    """Реестр клавиатур с готовым JSON; клавиатуры из реестра нельзя изменять"""
+
+    def __init__(self):
+        self._markups: dict[str, Any] = {}
+        # id стабилен: клавиатуры реестра живут до конца процесса
+        self._json: dict[int, str | None] = {}
+
+    def add(self, name: str, markup):
+        self._markups[name] = markup
+        self._json[id(markup)] = None
+        return markup
+
+    def __getitem__(self, name: str):
+        return self._markups[name]
+
+    def serialized(self, markup, session: AiohttpSession, bot: Bot) -> str | None:
+        """JSON клавиатуры из реестра (считается один раз) или None для остальных"""
+        if markup is None:
+            return None
+        key = id(markup)
+        if key not in self._json:
+            return None
+        value = self._json[key]
+        if value is None:
+            value = session.prepare_value(markup.model_dump(warnings=False), bot=bot, files={})
+            self._json[key] = value
+        return value
+
+
+registry = KeyboardRegistry()
+
+
+class PrebuiltMarkupSession(AiohttpSession):
+    """Сессия Bot API, которая подставляет готовый JSON клавиатур из реестра"""
+
+    def __init__(self, keyboards: KeyboardRegistry = registry, **kwargs):
+        super().__init__(**kwargs)
+        self.keyboards = keyboards
+
+    def build_form_data(self, bot: Bot, method: TelegramMethod) -> FormData:
+        markup_json = self.keyboards.serialized(getattr(method, "reply_markup", None), self, bot)
+        if markup_json is None:
+            return super().build_form_data(bot, method)
+
+        # как AiohttpSession.build_form_data, но без model_dump клавиатуры
+        form = FormData(quote_fields=False)
+        files = {}
+        for key, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if not value:
+                continue
+            form.add_field(key, value)
+        form.add_field("reply_markup", markup_json)
+        for key, value in files.items():
+            form.add_field(key, value.read(bot), filename=value.filename or key)
+        return form
+
+
+# ================== КЛАВИАТУРЫ ==================
+def build_timezone_keyboard() -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text="🇷🇺 Москва (UTC+3)")],
+            [KeyboardButton(text="🇬🇪 Батуми (UTC+4)")],
+            [KeyboardButton(text="🇷🇺 Самара (UTC+4)")],
+            [KeyboardButton(text="🇷🇺 Екатеринбург (UTC+5)")],
+            [KeyboardButton(text="🇬🇧 Лондон (UTC+0)")],
+            [KeyboardButton(text="🇹🇭 Бангкок (UTC+7)")],
+            [KeyboardButton(text="Другой часовой пояс")],
+            [KeyboardButton(text="Пропустить")],
+        ],
+        resize_keyboard=True,
+        one_time_keyboard=True,
+    )
+
+
+def build_main_keyboard() -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text="📊 Отчет за сегодня"), KeyboardButton(text="⏰ Начать")],
+            [KeyboardButton(text="🔄 Другие отчеты"), KeyboardButton(text="⏹️ Стоп")],
+        ],
+        resize_keyboard=True,
+    )
+
+
+def build_reports_submenu() -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text="📆 Отчет по дате"), KeyboardButton(text="📋 Отчет по задаче")],
+            [KeyboardButton(text="📈 Отчет за период"), KeyboardButton(text="📥 Экспорт в CSV")],
+            [KeyboardButton(text="🔙 Назад")],
+        ],
+        resize_keyboard=True,
+        one_time_keyboard=True,
+    )
+
+
+def build_yes_no_keyboard() -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text="✅ Да"), KeyboardButton(text="❌ Нет")]],
+        resize_keyboard=True,
+        one_time_keyboard=True,
+    )
+
+
+def build_range_presets_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="Эта неделя", callback_data="range:week"),
+                InlineKeyboardButton(text="Прошлая неделя", callback_data="range:prev_week"),
+            ],
+            [
+                InlineKeyboardButton(text="Этот месяц", callback_data="range:month"),
+                InlineKeyboardButton(text="Прошлый месяц", callback_data="range:prev_month"),
+            ],
+            [
+                InlineKeyboardButton(text="30 дней", callback_data="range:30d"),
+                InlineKeyboardButton(text="Этот год", callback_data="range:year"),
+            ],
+            [InlineKeyboardButton(text="📅 Выбрать в календаре", callback_data="range:pick")],
+            [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_calendar")],
+        ]
+    )
+
+
+def build_premium_offer_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="💎 Купить премиум (99 ₽)", callback_data="buy_premium")]
+        ]
+    )
+
+
+TIMEZONE_KEYBOARD = registry.add("timezone", build_timezone_keyboard())
+MAIN_KEYBOARD = registry.add("main", build_main_keyboard())
+REPORTS_SUBMENU = registry.add("reports", build_reports_submenu())
+YES_NO_KEYBOARD = registry.add("yes_no", build_yes_no_keyboard())
+RANGE_PRESETS_KEYBOARD = registry.add("range_presets", build_range_presets_keyboard())
+PREMIUM_OFFER_KEYBOARD = registry.add("premium_offer", build_premium_offer_keyboard())
+
+
+# ================== ЗАМЕР ==================
+def benchmark(messages: int = 20000):
+    """Сравнивает сборку клавиатуры на каждое сообщение и реестр (время и аллокации)"""
+    import time
+    import tracemalloc
+
+    from aiogram.methods import SendMessage
+
+    bot = Bot("42:fake-token")
+    plain = AiohttpSession()
+    prebuilt = PrebuiltMarkupSession()
+
+    def per_message_rebuild():
+        method = SendMessage(chat_id=1, text="ok", reply_markup=build_main_keyboard())
+        plain.build_form_data(bot, method)
+
+    def per_message_registry():
+        method = SendMessage(chat_id=1, text="ok", reply_markup=MAIN_KEYBOARD)
+        prebuilt.build_form_data(bot, method)
+
+    for name, func in (("пересборка", per_message_rebuild), ("реестр", per_message_registry)):
+        func()
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+        for _ in range(messages):
+            func()
+        per_message_us = (time.perf_counter() - started) / messages * 1e6
+        print(f"{name}: {per_message_us:.1f} мкс/сообщение, пик памяти {peak} Б на сообщение")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,198 @@
+"""Живой статус запущенных таймеров: сообщение о старте правится на месте.
+
+Все таймеры обслуживает один планировщик на куче сроков (heapq), а не
+задача на пользователя. Правки идут через свой token bucket и общий с
+рассылками ChatRateLimiter. Если правки не успевают, пропущенные такты
+схлопываются: у таймера всегда не больше одной ожидающей правки.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from broadcast import classify_send_error
+from ratelimit import ChatRateLimiter, TokenBucket
+from reports import format_duration, md_bold
+
+# ================== НАСТРОЙКИ ЖИВОГО СТАТУСА ==================
+# Как часто обновлять статус таймера (секунды); 0 — выключено
+LIVE_STATUS_INTERVAL = float(os.getenv("LIVE_STATUS_INTERVAL", "0"))
+# Правок в секунду на весь бот (ответам пользователям нужен запас до ~30/с)
+LIVE_STATUS_RATE = float(os.getenv("LIVE_STATUS_RATE", "10"))
+# Таймер, забытый дольше этого (секунды), больше не обновляется
+LIVE_STATUS_MAX_AGE = float(os.getenv("LIVE_STATUS_MAX_AGE", str(12 * 3600)))
+
+
+class _LiveTimer:
+    __slots__ = ("chat_id", "message_id", "task_number", "start_time", "generation")
+
+    def __init__(self, chat_id: int, message_id: int, task_number: str, start_time: float, generation: int):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.task_number = task_number
+        self.start_time = start_time
+        self.generation = generation
+
+
+def status_text(task_number: str, elapsed: float) -> str:
+    return f"✅ Запущен таймер для {md_bold(task_number)}\n⏳ Идет: {format_duration(int(elapsed))}"
+
+
+class LiveTimerStatus:
+    """Периодически правит сообщения запущенных таймеров"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        limiter: ChatRateLimiter,
+        interval: float = LIVE_STATUS_INTERVAL,
+        rate: float = LIVE_STATUS_RATE,
+        max_age: float = LIVE_STATUS_MAX_AGE,
+    ):
+        self.bot = bot
+        self.limiter = limiter
+        self.interval = interval
+        self.max_age = max_age
+        self.bucket = TokenBucket(rate)
+        self._timers: dict[int, _LiveTimer] = {}
+        # (срок по monotonic, поколение, user_id); устаревшие записи выбрасываются при извлечении
+        self._heap: list[tuple[float, int, int]] = []
+        self._generations = itertools.count(1)
+        self._wakeup = asyncio.Event()
+        self._scheduler: asyncio.Task | None = None
+        # правка в полёте на пользователя: пока она идёт, новый такт пропускается
+        self._edits: dict[int, asyncio.Task] = {}
+
+        # статистика
+        self.sent = 0
+        self.failed = 0
+        self.late = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def track(self, user_id: int, chat_id: int, message_id: int, task_number: str, start_time: float):
+        """Начинает обновлять сообщение message_id о запущенном таймере"""
+        if not self.enabled:
+            return
+        generation = next(self._generations)
+        self._timers[user_id] = _LiveTimer(chat_id, message_id, task_number, start_time, generation)
+        heapq.heappush(self._heap, (time.monotonic() + self.interval, generation, user_id))
+        self._wakeup.set()
+        if self._scheduler is None or self._scheduler.done():
+            self._scheduler = asyncio.create_task(self._run())
+
+    def untrack(self, user_id: int, generation: int | None = None):
+        """Таймер остановлен: запись в куче устаревает, правка в полёте отменяется.
+
+        generation — снять только этот запуск таймера, а не начатый позже.
+        """
+        timer = self._timers.get(user_id)
+        if timer is None or (generation is not None and timer.generation != generation):
+            return
+        del self._timers[user_id]
+        edit = self._edits.pop(user_id, None)
+        if edit is not None and edit is not asyncio.current_task():
+            edit.cancel()
+
+    def _current(self, generation: int, user_id: int) -> _LiveTimer | None:
+        timer = self._timers.get(user_id)
+        return timer if timer and timer.generation == generation else None
+
+    async def _run(self):
+        while True:
+            while self._heap and self._current(self._heap[0][1], self._heap[0][2]) is None:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due, generation, user_id = heapq.heappop(self._heap)
+            timer = self._current(generation, user_id)
+            if timer is None:
+                continue
+            if user_id in self._edits:
+                # прошлая правка ещё идёт — этот такт схлопывается со следующим
+                heapq.heappush(self._heap, (time.monotonic() + self.interval, generation, user_id))
+                continue
+            # ждём лимиты здесь, а не в задаче правки: очередь правок не растёт
+            await self.bucket.acquire()
+            await self.limiter.acquire(timer.chat_id)
+            if self._current(generation, user_id) is None:
+                continue
+            now = time.monotonic()
+            if now - due > self.interval:
+                self.late += 1
+            if time.time() - timer.start_time > self.max_age:
+                self.untrack(user_id, generation)
+                continue
+
+            # следующий такт считаем от текущего момента: опоздавшие правки не копятся
+            heapq.heappush(self._heap, (now + self.interval, generation, user_id))
+            edit = asyncio.create_task(self._edit(user_id, timer))
+            self._edits[user_id] = edit
+            edit.add_done_callback(lambda task, user_id=user_id: self._forget_edit(user_id, task))
+
+    def _forget_edit(self, user_id: int, edit: asyncio.Task):
+        if self._edits.get(user_id) is edit:
+            del self._edits[user_id]
+
+    async def _edit(self, user_id: int, timer: _LiveTimer):
+        try:
+            await self.bot.edit_message_text(
+                status_text(timer.task_number, time.time() - timer.start_time),
+                chat_id=timer.chat_id,
+                message_id=timer.message_id,
+                parse_mode="Markdown",
+            )
+            self.sent += 1
+        except TelegramRetryAfter as e:
+            self.limiter.retry_after(e.retry_after)
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e).lower():
+                # сообщение удалено или его нельзя править — больше не трогаем
+                self.failed += 1
+                self.untrack(user_id, timer.generation)
+        except Exception as e:
+            self.failed += 1
+            if classify_send_error(e):
+                self.untrack(user_id, timer.generation)
+            else:
+                print(f"Ошибка обновления статуса таймера {user_id}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self._timers),
+            "queued": len(self._heap),
+            "sent": self.sent,
+            "failed": self.failed,
+            "late": self.late,
+        }
+
+    async def close(self):
+        if self._scheduler:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except asyncio.CancelledError:
+                pass
+            self._scheduler = None
+        edits = list(self._edits.values())
+        for edit in edits:
+            edit.cancel()
+        await asyncio.gather(*edits, return_exceptions=True)
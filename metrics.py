@@ -0,0 +1,159 @@
+"""Метрики процесса в формате Prometheus (text exposition 0.0.4).
+
+Гистограммы задержек обработчиков и запросов к БД, счётчики ошибок и
+апдейтов. Запись потокобезопасна: запросы к БД пишут метрики из потоков БД.
+"""
+import bisect
+import os
+import threading
+import time
+
+# Адрес HTTP-эндпоинта /metrics (только локальный); порт 0 (по умолчанию) — не запускать.
+# Шарды слушают METRICS_PORT + 1, + 2, ...
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Границы корзин гистограмм задержек (секунды)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "timebot_updates_total": ("counter", "Обработанные апдейты по типу"),
+    "timebot_update_duration_seconds": ("histogram", "Полное время обработки апдейта"),
+    "timebot_handler_duration_seconds": ("histogram", "Время работы обработчика"),
+    "timebot_handler_errors_total": ("counter", "Исключения в обработчиках"),
+    "timebot_throttled_total": ("counter", "Отброшенные апдейты: лимит, дубликат, повтор доставки"),
+    "timebot_db_query_duration_seconds": ("histogram", "Время выполнения запроса к БД"),
+    "timebot_db_wait_seconds": ("histogram", "Ожидание потока БД, соединения из пула или блокировки записи"),
+    "timebot_db_write_batch_size": ("histogram", "Операций в одной транзакции групповой записи"),
+}
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[idx - 1] if idx > 0 else 0.0
+                if idx == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[idx] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{key}="{str(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[tuple[str, tuple], float] = {}
+        self.histograms: dict[tuple[str, tuple], Histogram] = {}
+        self.started_at = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: tuple[float, ...] = LATENCY_BUCKETS, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def histogram_summary(self, name: str, label: str) -> list[dict]:
+        """Сводка гистограмм метрики по значению метки, самые затратные сверху"""
+        with self._lock:
+            rows = [
+                {
+                    label: dict(labels).get(label, ""),
+                    "count": histogram.count,
+                    "avg_ms": histogram.sum / histogram.count * 1000 if histogram.count else 0.0,
+                    "p99_ms": histogram.quantile(0.99) * 1000,
+                    "total_s": histogram.sum,
+                }
+                for (metric, labels), histogram in self.histograms.items()
+                if metric == name
+            ]
+        return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+    def counter_values(self, name: str, label: str) -> dict[str, float]:
+        with self._lock:
+            return {
+                dict(labels).get(label, ""): value
+                for (metric, labels), value in self.counters.items()
+                if metric == name
+            }
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            names = sorted({name for name, _ in self.counters} | {name for name, _ in self.histograms})
+            for name in names:
+                kind, help_text = HELP.get(name, ("untyped", ""))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        bucket_labels = _format_labels(labels, 'le="%s"' % bound)
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    bucket_labels = _format_labels(labels, 'le="+Inf"')
+                    lines.append(f"{name}_bucket{bucket_labels} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        lines.append("# TYPE timebot_start_time_seconds gauge")
+        lines.append(f"timebot_start_time_seconds {self.started_at}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+async def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """HTTP-сервер с GET /metrics; возвращает AppRunner для остановки"""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"📈 Метрики: http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,258 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import TelegramObject, Update
+
+from cache import LRUCache, MISSING
+from metrics import metrics
+from profiling import SlowHandlerProfiler
+from ratelimit import TokenBucket
+
+# ================== НАСТРОЙКИ ОГРАНИЧЕНИЙ ==================
+# Апдейтов в секунду на пользователя (0 — без ограничения) и запас на всплеск
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "2"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "8"))
+# Повторное нажатие той же кнопки того же сообщения в течение окна отбрасывается
+DEDUP_WINDOW = float(os.getenv("DEDUP_WINDOW", "1.0"))
+# Не чаще раза в столько секунд предупреждаем чат о лимите (флуд не должен тратить лимит отправки)
+THROTTLE_NOTICE_INTERVAL = 10.0
+# Сколько пользователей помнить (бакеты, последние апдейты)
+THROTTLE_USERS = int(os.getenv("THROTTLE_USERS", "50000"))
+# Навигация, в которой из серии нажатий важна только последняя
+DEBOUNCE_PREFIXES = ("cal:",)
+# Типы апдейтов под ограничениями (платежи не трогаем)
+THROTTLED_TYPES = ("message", "callback_query", "inline_query")
+
+
+def _handler_name(data: dict[str, Any]) -> str:
+    handler_object = data.get("handler")
+    return handler_object.callback.__name__ if handler_object else "unknown"
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: поток апдейтов по типам и полное время обработки"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        update_type = event.event_type
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.observe(
+                "timebot_update_duration_seconds", time.perf_counter() - started, type=update_type
+            )
+            metrics.inc("timebot_updates_total", type=update_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: задержка и ошибки каждого обработчика по имени функции"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        name = _handler_name(data)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.inc("timebot_handler_errors_total", handler=name)
+            raise
+        finally:
+            metrics.observe(
+                "timebot_handler_duration_seconds", time.perf_counter() - started, handler=name
+            )
+
+
+def setup_metrics(dp: Dispatcher):
+    """Подключает метрики ко всем типам апдейтов диспетчера"""
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(HandlerMetricsMiddleware())
+
+
+class SlowHandlerProfilerMiddleware(BaseMiddleware):
+    """Внутренний middleware: профиль стеков для обработчиков дольше порога"""
+
+    def __init__(self, profiler: SlowHandlerProfiler):
+        self.profiler = profiler
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        trace = self.profiler.begin(_handler_name(data))
+        if trace is None:
+            return await handler(event, data)
+        try:
+            return await handler(event, data)
+        finally:
+            await self.profiler.finish(trace)
+
+
+def setup_profiling(dp: Dispatcher, profiler: SlowHandlerProfiler):
+    """Подключает профилировщик медленных обработчиков ко всем типам апдейтов"""
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(SlowHandlerProfilerMiddleware(profiler))
+
+
+class _NavigationSlot:
+    __slots__ = ("latest", "running", "changed")
+
+    def __init__(self):
+        self.latest = 0
+        self.running = False
+        self.changed = asyncio.Condition()
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: защищает общую БД от шумных клиентов.
+
+    - повторная доставка того же update_id отбрасывается, как и повторное
+      нажатие той же кнопки того же сообщения в течение DEDUP_WINDOW
+      (тексты не сравниваются: повтор сообщения — осознанное действие);
+    - серия нажатий навигации (DEBOUNCE_PREFIXES) по одному сообщению
+      схлопывается: пока отрисовывается одно нажатие, ждёт только последнее;
+    - остальное проходит через token bucket пользователя.
+    """
+
+    def __init__(
+        self,
+        rate: float = THROTTLE_RATE,
+        burst: float = THROTTLE_BURST,
+        dedup_window: float = DEDUP_WINDOW,
+        debounce_prefixes: tuple[str, ...] = DEBOUNCE_PREFIXES,
+        exempt: set[int] | None = None,
+        max_users: int = THROTTLE_USERS,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.dedup_window = dedup_window
+        self.debounce_prefixes = debounce_prefixes
+        self.exempt = exempt or set()
+        self._buckets = LRUCache(max_users)
+        self._last_payload = LRUCache(max_users, ttl=dedup_window)
+        self._seen_updates = LRUCache(max_users)
+        self._noticed = LRUCache(max_users, ttl=THROTTLE_NOTICE_INTERVAL)
+        self._navigation: dict[tuple[int, int], _NavigationSlot] = {}
+
+    @staticmethod
+    def _payload(event: Update) -> tuple | None:
+        if event.callback_query and event.callback_query.message:
+            return (event.callback_query.message.message_id, event.callback_query.data)
+        return None
+
+    def _allow(self, user_id: int) -> bool:
+        if not self.rate:
+            return True
+        bucket = self._buckets.get(user_id)
+        if bucket is MISSING:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets.set(user_id, bucket)
+        return bucket.try_acquire()
+
+    async def _drop(self, event: Update, reason: str, notice: str | None = None):
+        metrics.inc("timebot_throttled_total", reason=reason)
+        try:
+            if event.callback_query:
+                # без ответа у пользователя крутятся часики на кнопке
+                await event.callback_query.answer(notice)
+            elif event.inline_query:
+                # пустой ответ без кэша: следующий запрос пользователя отработает как обычно
+                await event.inline_query.answer([], cache_time=0, is_personal=True)
+            elif notice and event.message and self._noticed.get(event.message.chat.id) is MISSING:
+                self._noticed.set(event.message.chat.id, True)
+                await event.message.answer(notice)
+        except TelegramAPIError as e:
+            # ответ на отброшенный апдейт не важен: лимит Telegram или чат недоступен
+            print(f"Не удалось ответить на отброшенный апдейт {event.update_id}: {e}")
+
+    async def _debounced(self, key: tuple[int, int], handler, event: Update, data: dict[str, Any]):
+        """Выполняет только последнее нажатие из серии по одному сообщению"""
+        slot = self._navigation.get(key)
+        if slot is None:
+            slot = self._navigation[key] = _NavigationSlot()
+        slot.latest += 1
+        seq = slot.latest
+        async with slot.changed:
+            await slot.changed.wait_for(lambda: not slot.running)
+            if seq != slot.latest:
+                superseded = True
+            else:
+                superseded = False
+                slot.running = True
+        if superseded:
+            await self._drop(event, "superseded")
+            return None
+
+        try:
+            return await handler(event, data)
+        finally:
+            async with slot.changed:
+                slot.running = False
+                slot.changed.notify_all()
+            if slot.latest == seq:
+                self._navigation.pop(key, None)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if (
+            user is None
+            or user.id in self.exempt
+            or event.event_type not in THROTTLED_TYPES
+            or (event.message and event.message.successful_payment)
+        ):
+            return await handler(event, data)
+
+        # Telegram повторно доставил тот же апдейт (webhook, таймаут ответа)
+        if self._seen_updates.get(event.update_id) is not MISSING:
+            metrics.inc("timebot_throttled_total", reason="redelivery")
+            return None
+        self._seen_updates.set(event.update_id, True)
+
+        payload = self._payload(event)
+        if payload is not None and self.dedup_window:
+            if self._last_payload.get(user.id) == payload:
+                await self._drop(event, "duplicate")
+                return None
+            self._last_payload.set(user.id, payload)
+
+        if (
+            event.callback_query
+            and event.callback_query.message
+            and (event.callback_query.data or "").startswith(self.debounce_prefixes)
+        ):
+            key = (user.id, event.callback_query.message.message_id)
+            return await self._debounced(key, handler, event, data)
+
+        if not self._allow(user.id):
+            await self._drop(event, "rate", "⏳ Слишком много запросов. Подождите немного.")
+            return None
+        return await handler(event, data)
+
+
+def setup_throttling(dp: Dispatcher, exempt: set[int] | None = None) -> ThrottlingMiddleware:
+    """Подключает ограничения и дедупликацию до обработчиков"""
+    middleware = ThrottlingMiddleware(exempt=exempt)
+    dp.update.outer_middleware(middleware)
+    return middleware
@@ -0,0 +1,171 @@
+"""Профилировщик медленных обработчиков на выборке стеков.
+
+Пока профилирование включено и идёт хотя бы один апдейт, фоновый поток раз
+в PROFILE_INTERVAL снимает стеки потока event loop и потоков БД. Если
+обработчик работал дольше порога, стеки за время его работы пишутся в
+DATA_DIR/profiles в свёрнутом формате (folded), который понимают
+flamegraph.pl и speedscope:
+
+    flamegraph.pl 20260101-120000-000000_stop_timer_812ms.folded > stop_timer.svg
+
+Апдейты обрабатываются конкурентно, поэтому в выборку попадают и соседние
+корутины; поток event loop в select означает ожидание (БД, Bot API).
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from db import DATA_DIR
+
+# Профилирование при старте (переключается командой /profile)
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0") == "1"
+# Обработчики дольше стольких миллисекунд сохраняются в профиль
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+# Период выборки стеков (секунды)
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+# Сколько последних профилей хранить
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_DIR = DATA_DIR / "profiles"
+
+# Глубже этого стек обрезается (корень event loop всё равно одинаковый)
+MAX_STACK_DEPTH = 64
+# Потоки БД в простое ждут задачу в очереди — такие стеки не пишем
+_IDLE_LEAVES = {"thread.py:_worker", "threading.py:wait", "queue.py:get"}
+
+
+class _Trace:
+    __slots__ = ("handler", "started", "stacks")
+
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.started = time.perf_counter()
+        self.stacks: Counter[str] = Counter()
+
+
+def _fold(frame) -> tuple[str, str]:
+    """Стек кадра в строку folded (корень слева) и верхний кадр"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names)), names[0]
+
+
+class SlowHandlerProfiler:
+    """Снимает стеки, пока идут апдейты, и сохраняет профили медленных обработчиков"""
+
+    def __init__(
+        self,
+        directory: Path = PROFILE_DIR,
+        threshold_ms: float = PROFILE_SLOW_MS,
+        interval: float = PROFILE_INTERVAL,
+        keep: int = PROFILE_KEEP,
+        enabled: bool = PROFILE_ENABLED,
+    ):
+        self.directory = directory
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.keep = keep
+        self.enabled = enabled
+        self._active: set[_Trace] = set()
+        self._lock = threading.Lock()
+        self._sampler: threading.Thread | None = None
+        self._loop_thread_id: int | None = None
+
+        # статистика
+        self.samples = 0
+        self.dumps = 0
+
+    def begin(self, handler: str) -> _Trace | None:
+        """Начинает запись стеков для обработчика; None, если профилирование выключено"""
+        if not self.enabled:
+            return None
+        trace = _Trace(handler)
+        self._loop_thread_id = threading.get_ident()
+        with self._lock:
+            self._active.add(trace)
+            if self._sampler is None:
+                self._sampler = threading.Thread(
+                    target=self._sample_loop, name="profiler", daemon=True
+                )
+                self._sampler.start()
+        return trace
+
+    async def finish(self, trace: _Trace) -> Path | None:
+        """Завершает запись; профиль медленного обработчика пишется на диск вне event loop"""
+        # после discard поток выборки trace не трогает; копия снимается под той же блокировкой
+        with self._lock:
+            self._active.discard(trace)
+            stacks = Counter(trace.stacks)
+        elapsed_ms = (time.perf_counter() - trace.started) * 1000
+        if elapsed_ms < self.threshold_ms or not stacks:
+            return None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._dump, trace.handler, stacks, elapsed_ms)
+
+    def _sample_loop(self):
+        sampler_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                traces = list(self._active)
+
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_id:
+                    continue
+                name = thread_names.get(thread_id, str(thread_id))
+                is_loop = thread_id == self._loop_thread_id
+                if not is_loop and not name.startswith("db"):
+                    continue
+                stack, leaf = _fold(frame)
+                if not is_loop and leaf in _IDLE_LEAVES:
+                    continue
+                stacks.append(f"{'event_loop' if is_loop else name};{stack}")
+
+            with self._lock:
+                for trace in traces:
+                    # обработчик мог завершиться, пока снимались стеки
+                    if trace in self._active:
+                        trace.stacks.update(stacks)
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def _dump(self, handler: str, stacks: Counter, elapsed_ms: float) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / (
+            f"{datetime.now():%Y%m%d-%H%M%S-%f}_{handler}_{elapsed_ms:.0f}ms.folded"
+        )
+        path.write_text(
+            "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()),
+            encoding="utf-8",
+        )
+        self.dumps += 1
+        print(f"🐢 Медленный обработчик {handler}: {elapsed_ms:.0f} мс, профиль {path.name}")
+
+        # ротация: оставляем только последние keep профилей
+        for old in self.profiles()[self.keep:]:
+            old.unlink(missing_ok=True)
+        return path
+
+    def profiles(self) -> list[Path]:
+        """Сохранённые профили, самые новые первыми"""
+        if not self.directory.exists():
+            return []
+        return sorted(self.directory.glob("*.folded"), reverse=True)
+
+    def latest(self) -> Path | None:
+        profiles = self.profiles()
+        return profiles[0] if profiles else None
+
+
+profiler = SlowHandlerProfiler()
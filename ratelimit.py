@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+
+# ================== ОГРАНИЧЕНИЕ СКОРОСТИ ==================
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        """Берёт токен без ожидания; False, если токенов нет"""
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return False
+        self._refill(now)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        """Ждёт, пока появится токен, и забирает его (ожидающие идут по очереди)"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def block(self, seconds: float):
+        """Запрещает выдачу токенов на seconds секунд (например, после RetryAfter)"""
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        self._refill(now)
+        self._tokens = 0
+
+
+class ChatRateLimiter:
+    """Лимиты Telegram: общий token bucket на бота и минимальный интервал на чат"""
+
+    def __init__(self, global_rate: float = 25, per_chat_interval: float = 1.0):
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_interval = per_chat_interval
+        self._next_chat_slot: dict[int, float] = {}
+
+    async def acquire(self, chat_id: int):
+        now = time.monotonic()
+        slot = self._next_chat_slot.get(chat_id, 0.0)
+        self._next_chat_slot[chat_id] = max(now, slot) + self.per_chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        await self.global_bucket.acquire()
+
+        # чистим устаревшие слоты, чтобы словарь не рос бесконечно
+        if len(self._next_chat_slot) > 10000:
+            now = time.monotonic()
+            self._next_chat_slot = {
+                chat: next_slot
+                for chat, next_slot in self._next_chat_slot.items()
+                if next_slot > now
+            }
+
+    def retry_after(self, seconds: float):
+        """Telegram ответил RetryAfter: приостанавливаем все отправки"""
+        self.global_bucket.block(seconds)
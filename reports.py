@@ -0,0 +1,122 @@
+"""Сборка текстов отчетов для parse_mode=Markdown с разбиением по лимиту Telegram."""
+import itertools
+import re
+
+from cache import LRUCache, MISSING
+
+# Максимальная длина текста сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+_MD_SPECIAL = re.compile(r"([_*`\[])")
+
+
+def format_duration(seconds: int) -> str:
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+
+
+def md_escape(text: str) -> str:
+    """Экранирует пользовательский текст вне сущностей Markdown"""
+    return _MD_SPECIAL.sub(r"\\\1", text)
+
+
+def md_bold(text: str) -> str:
+    """Жирный пользовательский текст: '*' внутри закрывает и заново открывает сущность"""
+    return "*" + text.replace("*", "*\\**") + "*"
+
+
+class ReportBuilder:
+    """Собирает отчет из строк через list/join.
+
+    Каждая строка — законченный фрагмент Markdown, поэтому сообщения режутся
+    только между строками и сущности никогда не разрываются.
+    """
+
+    def __init__(self, limit: int = TELEGRAM_MESSAGE_LIMIT):
+        self.limit = limit
+        self._chunks: list[list[str]] = [[]]
+        self._size = 0
+
+    @staticmethod
+    def _cut(line: str, limit: int) -> str:
+        # строка длиннее сообщения (огромное описание) — обрезаем текст целиком
+        return line if len(line) <= limit else line[: limit - 1] + "…"
+
+    def fits(self, *lines: str) -> bool:
+        """Поместятся ли строки в текущее сообщение"""
+        extra = sum(len(line) + 1 for line in lines)
+        return self._size + extra <= self.limit
+
+    def add(self, *lines: str):
+        """Добавляет строки; не влезающие переносит в новое сообщение"""
+        if not self.fits(*lines) and self._chunks[-1]:
+            self._chunks.append([])
+            self._size = 0
+        for line in lines:
+            line = self._cut(line, self.limit)
+            if self._size + len(line) + 1 > self.limit and self._chunks[-1]:
+                self._chunks.append([])
+                self._size = 0
+            self._chunks[-1].append(line)
+            self._size += len(line) + 1
+
+    def chunks(self) -> list[str]:
+        return ["\n".join(lines) for lines in self._chunks if lines]
+
+    def text(self) -> str:
+        """Текст первого сообщения (для отчетов, которые листаются кнопкой)"""
+        return "\n".join(self._chunks[0])
+
+
+class _CachedReport:
+    __slots__ = ("version", "pages")
+
+    def __init__(self, version: int):
+        self.version = version
+        self.pages: dict = {}
+
+
+class ReportCache:
+    """Готовые страницы отчетов пользователя.
+
+    Запись — (user_id, вид отчета, ключ) со всеми страницами этого отчета,
+    поэтому новая задача сбрасывает отчет целиком. Версия хранится в самой
+    записи и берётся из общего счётчика: страница, собранная до сброса или
+    вытеснения записи, в кэш не попадает. Страниц на отчет не больше max_pages
+    (дальние страницы длинной истории читаются из БД).
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None, max_pages: int = 10):
+        self._reports = LRUCache(maxsize, ttl)
+        self.max_pages = max_pages
+        self._versions = itertools.count(1)
+
+    def version(self, user_id: int, kind: str, key) -> int:
+        """Версия отчета; запоминается до чтения БД и передаётся в set"""
+        report = (user_id, kind, key)
+        entry = self._reports.get(report)
+        if entry is MISSING:
+            entry = _CachedReport(next(self._versions))
+            self._reports.set(report, entry)
+        return entry.version
+
+    def get(self, user_id: int, kind: str, key, page):
+        entry = self._reports.get((user_id, kind, key))
+        if entry is MISSING:
+            return MISSING
+        return entry.pages.get(page, MISSING)
+
+    def set(self, user_id: int, kind: str, key, page, value, version: int):
+        entry = self._reports.get((user_id, kind, key))
+        # запись сброшена или вытеснена после version() — страница могла устареть
+        if entry is MISSING or entry.version != version:
+            return
+        if page in entry.pages or len(entry.pages) < self.max_pages:
+            entry.pages[page] = value
+
+    def invalidate(self, user_id: int, kind: str, key):
+        self._reports.invalidate((user_id, kind, key))
+
+    def stats(self) -> dict:
+        return self._reports.stats()
@@ -0,0 +1,199 @@
+"""Горизонтальное масштабирование: несколько процессов-шардов за одним роутером.
+
+Роутер принимает webhook от Telegram и пересылает апдейт в шард по user_id,
+поэтому FSM-состояние и таймер пользователя всегда обрабатывает один процесс.
+Каждый шард — обычный timebot.py в режиме webhook на своём локальном порту;
+упавший шард роутер перезапускает.
+
+Состояние в памяти у каждого шарда своё: лимиты отправки в Telegram
+(рассылки, живой статус) делятся на число шардов, а премиум-статус в шардах
+не кэшируется — /premium выполняется в шарде админа, а не пользователя.
+"""
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+
+from aiogram import Bot
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+
+from webhook import (
+    SECRET_HEADER,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    require_secret,
+    secret_matches,
+)
+
+# Как часто роутер проверяет, живы ли шарды (секунды)
+SHARD_CHECK_INTERVAL = float(os.getenv("SHARD_CHECK_INTERVAL", "1"))
+
+
+def update_user_id(update: dict) -> int | None:
+    """user_id автора апдейта (или id чата, если автора нет)"""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+
+def shard_for_user(user_id: int | None, shards: int) -> int:
+    """Номер шарда, который обслуживает пользователя"""
+    if not user_id or shards <= 1:
+        return 0
+    return user_id % shards
+
+
+def shard_port(index: int) -> int:
+    """Локальный порт шарда: следующие за портом роутера"""
+    return WEBAPP_PORT + 1 + index
+
+
+class ShardRouter:
+    """Пересылает апдейты в шарды; коды ответа шарда (429/503) уходят Telegram как есть"""
+
+    def __init__(self, shards: int, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET):
+        self.shards = shards
+        self.path = path
+        self.secret = require_secret(secret)
+        self.shard_urls = [
+            f"http://127.0.0.1:{shard_port(index)}{path}" for index in range(shards)
+        ]
+        self.forwarded = [0] * shards
+        self._session: ClientSession | None = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.on_startup.append(self._open_session)
+        app.on_cleanup.append(self._close_session)
+        return app
+
+    async def _open_session(self, app):
+        self._session = ClientSession(timeout=ClientTimeout(total=10))
+
+    async def _close_session(self, app):
+        await self._session.close()
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not secret_matches(request, self.secret):
+            return web.Response(status=401)
+
+        body = await request.read()
+        try:
+            index = shard_for_user(update_user_id(json.loads(body)), self.shards)
+        except (ValueError, AttributeError):
+            return web.Response(status=400)
+
+        headers = {"Content-Type": "application/json", SECRET_HEADER: self.secret}
+        try:
+            async with self._session.post(self.shard_urls[index], data=body, headers=headers) as response:
+                self.forwarded[index] += 1
+                return web.Response(status=response.status)
+        except (ClientError, asyncio.TimeoutError):
+            # шард ещё стартует или перезапускается — Telegram повторит доставку
+            return web.Response(status=503)
+
+
+def start_shard(script: str, index: int) -> subprocess.Popen:
+    """Запускает процесс-шард (timebot.py в режиме webhook на локальном порту)"""
+    env = {
+        **os.environ,
+        "BOT_MODE": "webhook",
+        "BOT_SHARD": str(index),
+        "WEBAPP_HOST": "127.0.0.1",
+        "WEBAPP_PORT": str(shard_port(index)),
+        # webhook в Telegram регистрирует только роутер
+        "WEBHOOK_BASE_URL": "",
+    }
+    return subprocess.Popen([sys.executable, script], env=env)
+
+
+def start_shards(script: str, shards: int) -> list[subprocess.Popen]:
+    """Запускает все процессы-шарды"""
+    return [start_shard(script, index) for index in range(shards)]
+
+
+async def supervise_shards(script: str, processes: list[subprocess.Popen], interval: float = SHARD_CHECK_INTERVAL):
+    """Перезапускает упавшие шарды: иначе их пользователи получали бы 503 до рестарта сервиса"""
+    while True:
+        await asyncio.sleep(interval)
+        for index, process in enumerate(processes):
+            code = process.poll()
+            if code is not None:
+                print(f"⚠️ Шард {index + 1} завершился с кодом {code}, перезапускаем")
+                processes[index] = start_shard(script, index)
+
+
+def stop_shards(processes: list[subprocess.Popen]):
+    """SIGTERM шардам: каждый дорабатывает принятые апдейты и завершается"""
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+    for process in processes:
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def serve_router(
+    bot: Bot,
+    script: str,
+    processes: list[subprocess.Popen],
+    host: str = WEBAPP_HOST,
+    port: int = WEBAPP_PORT,
+):
+    """Роутер работает до SIGINT/SIGTERM и следит за шардами processes"""
+    shards = len(processes)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    router = ShardRouter(shards)
+    runner = web.AppRunner(router.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=router.secret,
+        )
+    print(f"🔀 Роутер слушает {host}:{port}{WEBHOOK_PATH}, шардов: {shards}")
+
+    supervisor = asyncio.create_task(supervise_shards(script, processes))
+    try:
+        await stop_event.wait()
+    finally:
+        supervisor.cancel()
+        await site.stop()
+        await runner.cleanup()
+        await bot.session.close()
+        print(f"🔀 Переслано апдейтов по шардам: {router.forwarded}")
+
+
+def run_sharded(bot: Bot, script: str, shards: int):
+    """Запускает шарды и роутер; при остановке роутера останавливает шарды"""
+    require_secret(WEBHOOK_SECRET)
+    processes = start_shards(script, shards)
+    try:
+        asyncio.run(serve_router(bot, script, processes))
+    finally:
+        stop_shards(processes)
@@ -1,35 +1,64 @@
 import asyncio
+import calendar
+import sys
 import time
-import sqlite3
 from datetime import datetime, date, timedelta, timezone
 from aiogram import Bot, Dispatcher, types, F
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import (
-    ReplyKeyboardMarkup,
-    KeyboardButton,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
 )
 import os
-import csv
-from io import StringIO, BytesIO
-from pathlib import Path
 
-# ================== НАСТРОЙКИ БАЗЫ ДАННЫХ ==================
-# Путь к папке data
-DATA_DIR = Path("/data")
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-
-# Путь к базе данных
-DB_PATH = DATA_DIR / "tasks.db"
+import db
+from broadcast import BROADCAST_RATE, BroadcastEngine
+from cache import LRUCache, MISSING
+from fsm_storage import create_fsm_storage
+import metrics
+from keyboards import (
+    MAIN_KEYBOARD,
+    PREMIUM_OFFER_KEYBOARD,
+    RANGE_PRESETS_KEYBOARD,
+    REPORTS_SUBMENU,
+    TIMEZONE_KEYBOARD,
+    YES_NO_KEYBOARD,
+    PrebuiltMarkupSession,
+)
+from live_status import LIVE_STATUS_RATE, LiveTimerStatus
+from middlewares import setup_metrics, setup_profiling, setup_throttling
+from profiling import profiler
+from ratelimit import ChatRateLimiter
+from reports import (
+    TELEGRAM_MESSAGE_LIMIT,
+    ReportBuilder,
+    ReportCache,
+    format_duration,
+    md_bold,
+    md_escape,
+)
+from sharding import run_sharded, shard_for_user
+from webhook import WEBHOOK_SECRET, WebhookServer, require_secret
 
 # ================== НАСТРОЙКИ ==================
 # АДМИН ID - ИСПРАВЛЕНО: конвертируем в int
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 API_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Другой сервер Bot API (локальный или fake_telegram.py); пусто — api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Режим получения апдейтов: polling или webhook (настройки в webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Число процессов-шардов в режиме webhook (см. sharding.py)
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+# Номер шарда этого процесса; задаётся роутером, None — одиночный процесс
+SHARD_INDEX = int(os.environ["BOT_SHARD"]) if os.getenv("BOT_SHARD") else None
 
 # ЮKassa / провайдер платежей
 PROVIDER_TOKEN = os.getenv("PROVIDER_TOKEN")
@@ -39,9 +68,61 @@ PREMIUM_PRICE = 99  # руб/мес
 PREMIUM_TITLE = "Премиум навсегда"
 PREMIUM_DESCRIPTION = "Доступ к экспорту в CSV и дополнительным функциям"
 
-bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
+# Пользователей на одной странице /user_list
+USERS_PAGE_SIZE = 40
+
+# Задач на одной странице выбора задачи для отчета
+TASKS_PAGE_SIZE = 10
+# Максимальная длина названия задачи на кнопке
+TASK_BUTTON_LEN = 30
+# Текст, который отправляет выбранный в inline-поиске результат
+TASK_REPORT_PREFIX = "📋 Отчет по задаче: "
+
+# Сколько клавиатур календаря держать в памяти (месяц + отмеченные дни)
+CALENDAR_CACHE_SIZE = int(os.getenv("CALENDAR_CACHE_SIZE", "2048"))
+
+# Сколько задач показывать в отчете за период (остальные одной строкой)
+RANGE_REPORT_TOP_TASKS = 15
+# Сколько записей читать из БД на одну страницу отчета
+REPORT_PAGE_ROWS = 60
+# Описание длиннее обрезается в отчете (целиком оно есть в CSV)
+REPORT_DESCRIPTION_LEN = 1000
+# Готовые отчеты за день и по задаче: сколько держать в памяти и сколько секунд
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "5000"))
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "3600"))
+# Сколько страниц одного отчета держать в кэше
+REPORT_CACHE_PAGES = int(os.getenv("REPORT_CACHE_PAGES", "10"))
+
+# сессия подставляет готовый JSON клавиатур из keyboards.registry
+if TELEGRAM_API_URL:
+    bot = Bot(
+        token=API_TOKEN,
+        session=PrebuiltMarkupSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)),
+    )
+else:
+    bot = Bot(token=API_TOKEN, session=PrebuiltMarkupSession())
+
+# процесс-роутер только пересылает апдейты шардам: базу, FSM-хранилище и
+# Dispatcher поднимают сами шарды, лишний писатель в SQLite не нужен
+if __name__ == "__main__" and BOT_MODE == "webhook" and BOT_WORKERS > 1 and SHARD_INDEX is None:
+    run_sharded(bot, __file__, BOT_WORKERS)
+    sys.exit()
+
+# FSM-состояния (см. fsm_storage.FSM_STORAGE)
+storage = create_fsm_storage()
 dp = Dispatcher(storage=storage)
+setup_metrics(dp)
+# админ не ограничен: рассылки и массовые команды
+setup_throttling(dp, exempt={ADMIN_ID})
+setup_profiling(dp, profiler)
+# лимиты Telegram общие на бота: в шардах каждый процесс получает свою долю
+SEND_RATE_SHARE = BOT_WORKERS if SHARD_INDEX is not None else 1
+broadcasts = BroadcastEngine(bot, ChatRateLimiter(BROADCAST_RATE / SEND_RATE_SHARE))
+# правки статуса таймеров делят лимит Telegram с рассылками
+live_status = LiveTimerStatus(bot, broadcasts.limiter, rate=LIVE_STATUS_RATE / SEND_RATE_SHARE)
+calendar_cache = LRUCache(CALENDAR_CACHE_SIZE)
+# сбрасывается в stop_timer и save_description по дате и задаче записи
+report_cache = ReportCache(REPORT_CACHE_SIZE, REPORT_CACHE_TTL, REPORT_CACHE_PAGES)
 
 # ================== ЧАСОВЫЕ ПОЯСА ==================
 class SimpleTimezone:
@@ -78,6 +159,8 @@ class TaskTimer(StatesGroup):
     waiting_report_date = State()
     choosing_calendar_month = State()
     choosing_task_for_report = State()
+    choosing_range_start = State()
+    choosing_range_end = State()
     waiting_reports_menu = State()
     waiting_timezone_choice = State()
     waiting_custom_timezone = State()
@@ -86,356 +169,58 @@ class TaskTimer(StatesGroup):
     waiting_msg_to_all_message = State()
 
 
-# активные таймеры {user_id: {...}}
-active_timers = {}
+# активные таймеры {user_id: {...}} (см. db.TIMER_STORE)
+active_timers = db.create_timer_store()
 
 # ================== БАЗА ДАННЫХ ==================
-def init_db():
-    """Ваша функция создания базы с расширенными таблицами"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-
-    # Таблица пользователей (расширенная)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            first_name TEXT,
-            joined_date TEXT,
-            is_admin INTEGER DEFAULT 0,
-            is_premium INTEGER DEFAULT 0
-        )
-    ''')
-
-    # Таблица задач
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            task_number TEXT,
-            duration INTEGER,
-            date TEXT,
-            time_start TEXT,
-            description TEXT
-        )
-    ''')
-
-    # Часовые пояса
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_timezones (
-            user_id INTEGER PRIMARY KEY,
-            timezone TEXT
-        )
-    ''')
-
-    conn.commit()
-    conn.close()
-    print(f"База данных готова: {DB_PATH}")
-
-
-init_db()
+db.init_db()
 
 
-def log_user(user_id: int, username: str, first_name: str):
-    """Логирует нового пользователя в таблицу users"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        INSERT OR IGNORE INTO users (user_id, username, first_name, joined_date, is_admin, is_premium)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (
-            user_id,
-            username or "unknown",
-            first_name or "User",
-            date.today().isoformat(),
-            1 if user_id == ADMIN_ID else 0,
-            0,
-        ),
-    )
-    conn.commit()
-    conn.close()
-
-
-def get_statistics():
-    """Получает общую статистику по всему боту"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT COUNT(DISTINCT user_id) FROM tasks")
-    total_users = cursor.fetchone()[0]
-
-    seven_days_ago = (date.today() - timedelta(days=7)).isoformat()
-    cursor.execute(
-        "SELECT COUNT(DISTINCT user_id) FROM tasks WHERE date >= ?",
-        (seven_days_ago,),
-    )
-    active_users = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM tasks")
-    total_tasks = cursor.fetchone()[0]
-
-    cursor.execute("SELECT SUM(duration) FROM tasks")
-    total_seconds = cursor.fetchone()[0] or 0
-    total_hours = total_seconds / 3600
-    avg_hours = total_hours / total_users if total_users > 0 else 0
-
-    conn.close()
-
-    return {
-        "total_users": total_users,
-        "active_users": active_users,
-        "total_tasks": total_tasks,
-        "total_hours": round(total_hours, 1),
-        "avg_hours": round(avg_hours, 1),
-    }
-
-
-def get_user_stats(user_id: int):
-    """Получает статистику конкретного пользователя"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT username, first_name, joined_date FROM users WHERE user_id = ?",
-        (user_id,),
-    )
-    user_info = cursor.fetchone()
-
-    cursor.execute("SELECT COUNT(*) FROM tasks WHERE user_id = ?", (user_id,))
-    task_count = cursor.fetchone()[0]
-
-    cursor.execute("SELECT SUM(duration) FROM tasks WHERE user_id = ?", (user_id,))
-    total_seconds = cursor.fetchone()[0] or 0
-    total_hours = total_seconds / 3600
-
-    avg_time = total_seconds / task_count if task_count > 0 else 0
-    avg_minutes = avg_time / 60
-
-    cursor.execute("SELECT MAX(date) FROM tasks WHERE user_id = ?", (user_id,))
-    last_activity = cursor.fetchone()[0] or "нет активности"
-
-    conn.close()
-
-    return {
-        "username": user_info[0] if user_info else "unknown",
-        "first_name": user_info[1] if user_info else "User",
-        "joined_date": user_info[2] if user_info else "unknown",
-        "task_count": task_count,
-        "total_hours": round(total_hours, 1),
-        "avg_minutes": round(avg_minutes, 1),
-        "last_activity": last_activity,
-    }
-
-
-def get_all_user_ids() -> list[int]:
-    """Список всех user_id"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM users ORDER BY user_id")
-    users = cursor.fetchall()
-    conn.close()
-    return [user_id for (user_id,) in users]
-
-
-def get_all_users():
-    """Получает список всех пользователей с их статистикой"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM users ORDER BY user_id")
-    users = cursor.fetchall()
-    conn.close()
-
-    users_list = []
-    for (user_id,) in users:
-        stats = get_user_stats(user_id)
-        users_list.append({
-            "user_id": user_id,
-            **stats,
-        })
-
-    return users_list
-
-
-def get_non_premium_users():
-    """Получает список пользователей БЕЗ премиум-статуса"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT user_id FROM users WHERE is_premium = 0 AND user_id != ?",
-        (ADMIN_ID,),
-    )
-    users = cursor.fetchall()
-    conn.close()
-    return [user_id for (user_id,) in users]
-
-
-def is_premium_or_admin(user_id: int) -> bool:
-    """Проверяет, является ли пользователь админом или имеет премиум"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-
-    if user_id == ADMIN_ID:
-        conn.close()
-        return True
-
-    cursor.execute("SELECT is_premium FROM users WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-
-    return bool(result and result[0] == 1)
-
-
-def set_premium_status(user_id: int, status: int) -> bool:
-    """Устанавливает премиум-статус пользователю (0/1)"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET is_premium = ? WHERE user_id = ?",
-        (1 if status else 0, user_id),
-    )
-    conn.commit()
-    updated = cursor.rowcount > 0
-    conn.close()
-    return updated
-
-
-def generate_csv_report(user_id: int) -> BytesIO:
-    """Генерирует CSV файл с отчетом по задачам"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT task_number, date, time_start, duration, description
-        FROM tasks
-        WHERE user_id = ?
-        ORDER BY date DESC, time_start DESC
-        """,
-        (user_id,),
-    )
-    tasks = cursor.fetchall()
-    conn.close()
-
-    output = StringIO()
-    writer = csv.writer(output, lineterminator="\n")
-
-    headers = [
-        "№ по порядку",
-        "Дата задачи",
-        "Наименование задачи",
-        "Время начала",
-        "Время окончания",
-        "Всего затраченное время",
-        "Содержание работ",
-    ]
-    writer.writerow(headers)
-
-    if tasks:
-        for idx, (task_number, task_date, time_start, duration, description) in enumerate(tasks, 1):
-            # time_start в БД = фактическое время окончания
-            end_time = datetime.strptime(time_start, "%H:%M")
-            duration_td = timedelta(seconds=duration)
-            start_time = end_time - duration_td
-
-            hours, remainder = divmod(duration, 3600)
-            minutes, seconds = divmod(remainder, 60)
-            duration_str = f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}"
-
-            row = [
-                idx,
-                task_date,
-                task_number,
-                start_time.strftime("%H:%M"),  # реальное время начала
-                end_time.strftime("%H:%M"),    # реальное время окончания
-                duration_str,
-                description or "",
-            ]
-            writer.writerow(row)
-
-    csv_bytes = BytesIO(output.getvalue().encode("utf-8-sig"))
-    return csv_bytes
-
-
-def get_user_timezone(user_id: int) -> SimpleTimezone:
+async def get_user_timezone(user_id: int) -> SimpleTimezone:
     """Получает часовой пояс пользователя из БД"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT timezone FROM user_timezones WHERE user_id = ?",
-        (user_id,),
-    )
-    result = cursor.fetchone()
-    conn.close()
+    tz_name = await db.get_user_timezone(user_id)
 
-    if result and result[0]:
+    if tz_name:
         try:
-            return SimpleTimezone(result[0])
+            return SimpleTimezone(tz_name)
         except Exception:
             return MOSCOW_TZ
     return MOSCOW_TZ
 
 
-def save_user_timezone(user_id: int, timezone_str: str) -> bool:
+async def save_user_timezone(user_id: int, timezone_str: str) -> bool:
     """Сохраняет часовой пояс пользователя в БД"""
     if not SimpleTimezone.is_valid(timezone_str):
         return False
 
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR REPLACE INTO user_timezones (user_id, timezone) VALUES (?, ?)",
-        (user_id, timezone_str),
-    )
-    conn.commit()
-    conn.close()
+    await db.save_user_timezone(user_id, timezone_str)
     return True
 
 
+async def is_premium_or_admin(user_id: int) -> bool:
+    """Проверяет, является ли пользователь админом или имеет премиум"""
+    if user_id == ADMIN_ID:
+        return True
+
+    return await db.is_premium(user_id)
+
+
 # ================== КЛАВИАТУРЫ ==================
 def get_timezone_keyboard():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🇷🇺 Москва (UTC+3)")],
-            [KeyboardButton(text="🇬🇪 Батуми (UTC+4)")],
-            [KeyboardButton(text="🇷🇺 Самара (UTC+4)")],
-            [KeyboardButton(text="🇷🇺 Екатеринбург (UTC+5)")],
-            [KeyboardButton(text="🇬🇧 Лондон (UTC+0)")],
-            [KeyboardButton(text="🇹🇭 Бангкок (UTC+7)")],
-            [KeyboardButton(text="Другой часовой пояс")],
-            [KeyboardButton(text="Пропустить")],
-        ],
-        resize_keyboard=True,
-        one_time_keyboard=True,
-    )
-    return keyboard
+    return TIMEZONE_KEYBOARD
 
 
 def get_main_keyboard():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📊 Отчет за сегодня"), KeyboardButton(text="⏰ Начать")],
-            [KeyboardButton(text="🔄 Другие отчеты"), KeyboardButton(text="⏹️ Стоп")],
-        ],
-        resize_keyboard=True,
-    )
-    return keyboard
+    return MAIN_KEYBOARD
 
 
 def get_reports_submenu():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📆 Отчет по дате"), KeyboardButton(text="📋 Отчет по задаче")],
-            [KeyboardButton(text="📥 Экспорт в CSV")],
-            [KeyboardButton(text="🔙 Назад")],
-        ],
-        resize_keyboard=True,
-        one_time_keyboard=True,
-    )
-    return keyboard
+    return REPORTS_SUBMENU
 
 
-def get_calendar_keyboard(year: int, month: int) -> InlineKeyboardMarkup:
+def _build_calendar_keyboard(
+    year: int, month: int, marked_days: frozenset[int], only_marked: bool
+) -> InlineKeyboardMarkup:
     keyboard = []
 
     prev_year = year - 1 if month == 1 else year
@@ -456,25 +241,26 @@ def get_calendar_keyboard(year: int, month: int) -> InlineKeyboardMarkup:
         ),
     ])
 
-    first_day = datetime(year, month, 1)
-    if month < 12:
-        last_day = datetime(year, month + 1, 1) - timedelta(days=1)
-    else:
-        last_day = datetime(year + 1, 1, 1) - timedelta(days=1)
-
-    start_weekday = (first_day.weekday() + 1) % 7
+    first_weekday, days_in_month = calendar.monthrange(year, month)
+    start_weekday = (first_weekday + 1) % 7
     week = []
 
     for _ in range(start_weekday):
         week.append(InlineKeyboardButton(text=" ", callback_data="noop"))
 
-    for day in range(1, last_day.day + 1):
-        week.append(
-            InlineKeyboardButton(
-                text=str(day),
-                callback_data=f"date:{year}:{month:02d}:{day:02d}",
+    for day in range(1, days_in_month + 1):
+        if day in marked_days:
+            button = InlineKeyboardButton(
+                text=f"•{day}", callback_data=f"date:{year}:{month:02d}:{day:02d}"
             )
-        )
+        elif only_marked:
+            # пустой день: отвечаем сразу, без запроса отчета
+            button = InlineKeyboardButton(text=str(day), callback_data="noday")
+        else:
+            button = InlineKeyboardButton(
+                text=str(day), callback_data=f"date:{year}:{month:02d}:{day:02d}"
+            )
+        week.append(button)
         if len(week) == 7:
             keyboard.append(week)
             week = []
@@ -489,30 +275,69 @@ def get_calendar_keyboard(year: int, month: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_tasks_keyboard(user_id: int) -> InlineKeyboardMarkup | None:
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT DISTINCT task_number FROM tasks WHERE user_id = ? ORDER BY task_number",
-        (user_id,),
+def get_calendar_keyboard(
+    year: int, month: int, marked_days: frozenset[int] = frozenset(), only_marked: bool = False
+) -> InlineKeyboardMarkup:
+    """Клавиатура месяца из кэша: зависит только от месяца и отмеченных дней"""
+    key = (year, month, marked_days, only_marked)
+    keyboard = calendar_cache.get(key)
+    if keyboard is MISSING:
+        keyboard = _build_calendar_keyboard(year, month, marked_days, only_marked)
+        calendar_cache.set(key, keyboard)
+    return keyboard
+
+
+async def get_user_calendar(user_id: int, year: int, month: int, only_marked: bool = False) -> InlineKeyboardMarkup:
+    """Календарь с отметками дней, в которые пользователь записывал время"""
+    marked_days = await db.get_active_days(user_id, year, month)
+    return get_calendar_keyboard(year, month, frozenset(marked_days), only_marked)
+
+
+def get_range_presets_keyboard() -> InlineKeyboardMarkup:
+    return RANGE_PRESETS_KEYBOARD
+
+
+def short_task_name(name: str) -> str:
+    if len(name) <= TASK_BUTTON_LEN:
+        return name
+    return name[: TASK_BUTTON_LEN - 1] + "…"
+
+
+async def get_tasks_keyboard(user_id: int, page: int = 0) -> InlineKeyboardMarkup | None:
+    """Страница каталога задач: недавние сверху, в callback_data только id задачи"""
+    tasks, has_more = await db.get_task_catalog_page(
+        user_id, page * TASKS_PAGE_SIZE, TASKS_PAGE_SIZE
     )
-    tasks = cursor.fetchall()
-    conn.close()
 
-    if not tasks:
+    if not tasks and page == 0:
         return None
 
     keyboard = []
     row = []
 
-    for idx, (task_num,) in enumerate(tasks):
+    for idx, task in enumerate(tasks):
         row.append(
-            InlineKeyboardButton(text=task_num, callback_data=f"task:{task_num}")
+            InlineKeyboardButton(
+                text=short_task_name(task["name"]), callback_data=f"tc:{task['id']}"
+            )
         )
         if len(row) == 2 or idx == len(tasks) - 1:
             keyboard.append(row)
             row = []
 
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="◀ Назад", callback_data=f"tasks:{page - 1}"))
+    if has_more:
+        nav.append(InlineKeyboardButton(text="▶ Далее", callback_data=f"tasks:{page + 1}"))
+    if nav:
+        keyboard.append(nav)
+    if has_more or page > 0:
+        # inline-поиск по названию (нужен включённый inline-режим в @BotFather)
+        keyboard.append(
+            [InlineKeyboardButton(text="🔍 Поиск задачи", switch_inline_query_current_chat="")]
+        )
+
     keyboard.append(
         [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_tasks")]
     )
@@ -527,16 +352,9 @@ async def start_handler(message: types.Message, state: FSMContext):
     username = message.from_user.username
     first_name = message.from_user.first_name
 
-    log_user(user_id, username, first_name)
+    await db.log_user(user_id, username, first_name, is_admin=user_id == ADMIN_ID)
 
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT timezone FROM user_timezones WHERE user_id = ?",
-        (user_id,),
-    )
-    has_timezone = cursor.fetchone()
-    conn.close()
+    has_timezone = await db.get_user_timezone(user_id)
 
     if not has_timezone:
         await state.set_state(TaskTimer.waiting_timezone_choice)
@@ -585,7 +403,7 @@ async def handle_timezone_choice(message: types.Message, state: FSMContext):
     }
 
     if text in timezone_map:
-        save_user_timezone(user_id, timezone_map[text])
+        await save_user_timezone(user_id, timezone_map[text])
         if text == "Пропустить":
             await message.answer("⏭️ Установлен московский пояс (UTC+3)")
         else:
@@ -614,7 +432,7 @@ async def handle_custom_timezone(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     timezone_str = message.text.strip()
 
-    if save_user_timezone(user_id, timezone_str):
+    if await save_user_timezone(user_id, timezone_str):
         await message.answer(f"✅ Часовой пояс установлен: {timezone_str}")
         await state.clear()
         await message.answer(
@@ -633,7 +451,7 @@ async def handle_custom_timezone(message: types.Message, state: FSMContext):
 async def start_timer(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
 
-    if user_id in active_timers:
+    if await active_timers.get(user_id):
         await message.answer("⏳ Таймер уже запущен! Сначала нажми '⏹️ Стоп'.")
         return
 
@@ -645,55 +463,56 @@ async def start_timer(message: types.Message, state: FSMContext):
 async def save_task_number(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     task_number = message.text.strip()
+    start_time = time.time()
 
-    active_timers[user_id] = {
-        "start_time": time.time(),
-        "task_number": task_number,
-        "date": date.today().isoformat(),
-    }
+    started = await active_timers.start(
+        user_id, task_number, start_time, date.today().isoformat()
+    )
 
     await state.clear()
-    await message.answer(
+    if not started:
+        await message.answer(
+            "⏳ Таймер уже запущен! Сначала нажми '⏹️ Стоп'.",
+            reply_markup=get_main_keyboard(),
+        )
+        return
+
+    sent = await message.answer(
         f"✅ Запущен таймер для *{task_number}*\n⏳ Время идет...",
         reply_markup=get_main_keyboard(),
         parse_mode="Markdown",
     )
+    if live_status.enabled:
+        live_status.track(user_id, message.chat.id, sent.message_id, task_number, start_time)
+        # после рестарта статус продолжит обновляться (см. main)
+        await active_timers.set_status_message(user_id, message.chat.id, sent.message_id)
 
 
 @dp.message(F.text == "⏹️ Стоп")
 async def stop_timer(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
 
-    if user_id not in active_timers:
+    user_tz = await get_user_timezone(user_id)
+    time_start_str = user_tz.get_current_time().strftime("%H:%M")
+
+    # таймер снимается и задача пишется одной транзакцией: при ошибке таймер не теряется
+    finished_at = time.time()
+    finished = await active_timers.finish(user_id, finished_at, time_start_str)
+    live_status.untrack(user_id)
+    if not finished:
         await message.answer("⏰ Таймер не запущен! Нажми '⏰ Начать'.")
         return
 
-    timer_data = active_timers.pop(user_id)
-    start_time = timer_data["start_time"]
+    timer_data, task_id = finished
     task_number = timer_data["task_number"]
     date_str = timer_data["date"]
 
-    elapsed = time.time() - start_time
+    elapsed = finished_at - timer_data["start_time"]
     minutes, seconds = divmod(int(elapsed), 60)
     hours, minutes = divmod(minutes, 60)
     time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
-    user_tz = get_user_timezone(user_id)
-    now_user = user_tz.get_current_time()
-    time_start_str = now_user.strftime("%H:%M")
-
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        INSERT INTO tasks (user_id, task_number, duration, date, time_start, description)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (user_id, task_number, int(elapsed), date_str, time_start_str, None),
-    )
-    task_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    invalidate_reports(user_id, date_str, task_number)
 
     await state.update_data(last_task_id=task_id)
     await message.answer(
@@ -704,12 +523,7 @@ async def stop_timer(message: types.Message, state: FSMContext):
         reply_markup=get_main_keyboard(),
     )
 
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text="✅ Да"), KeyboardButton(text="❌ Нет")]],
-        resize_keyboard=True,
-        one_time_keyboard=True,
-    )
-    await message.answer("Добавить описание трудозатрат?", reply_markup=keyboard)
+    await message.answer("Добавить описание трудозатрат?", reply_markup=YES_NO_KEYBOARD)
     await state.set_state(TaskTimer.waiting_description_choice)
 
 
@@ -746,11 +560,7 @@ async def handle_description_choice(message: types.Message, state: FSMContext):
 
     await message.answer(
         "Выберите '✅ Да' или '❌ Нет'.",
-        reply_markup=ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text="✅ Да"), KeyboardButton(text="❌ Нет")]],
-            resize_keyboard=True,
-            one_time_keyboard=True,
-        ),
+        reply_markup=YES_NO_KEYBOARD,
     )
 
 
@@ -770,14 +580,9 @@ async def save_description(message: types.Message, state: FSMContext):
 
     description = message.text.strip()
 
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE tasks SET description = ? WHERE id = ? AND user_id = ?",
-        (description, task_id, user_id),
-    )
-    conn.commit()
-    conn.close()
+    updated = await db.set_task_description(user_id, task_id, description)
+    if updated:
+        invalidate_reports(user_id, *updated)
 
     await state.clear()
     await message.answer(
@@ -786,117 +591,212 @@ async def save_description(message: types.Message, state: FSMContext):
     )
 
 
-async def send_report_for_date(user_id: int, report_date: date, message: types.Message):
-    date_str = report_date.isoformat()
-
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT task_number, duration, time_start, description
-        FROM tasks
-        WHERE user_id = ? AND date = ?
-        ORDER BY time_start
-        """,
-        (user_id, date_str),
-    )
-    tasks = cursor.fetchall()
-    conn.close()
-
-    if not tasks:
+WEEKDAY_NAMES = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"]
+
+
+def period_bounds(preset: str, today: date) -> tuple[date, date] | None:
+    """Границы периода по названию пресета"""
+    if preset == "week":
+        return today - timedelta(days=today.weekday()), today
+    if preset == "prev_week":
+        end = today - timedelta(days=today.weekday() + 1)
+        return end - timedelta(days=6), end
+    if preset == "month":
+        return today.replace(day=1), today
+    if preset == "prev_month":
+        end = today.replace(day=1) - timedelta(days=1)
+        return end.replace(day=1), end
+    if preset == "30d":
+        return today - timedelta(days=29), today
+    if preset == "year":
+        return today.replace(month=1, day=1), today
+    return None
+
+
+async def send_range_report(user_id: int, date_from: date, date_to: date, message: types.Message):
+    """Сводка за период: итоги по дням (или месяцам) и по задачам из GROUP BY"""
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+    period_str = f"{date_from.isoformat()} — {date_to.isoformat()}"
+
+    summary = await db.get_range_summary(user_id, date_from.isoformat(), date_to.isoformat())
+    if not summary["total_count"]:
         await message.answer(
-            f"📊 За {date_str} задач нет.",
+            f"📈 За период {period_str} задач нет.",
             reply_markup=get_main_keyboard(),
         )
         return
 
-    total_duration = sum(task[1] for task in tasks)
-    total_hours, remainder = divmod(total_duration, 3600)
-    total_minutes, total_secs = divmod(remainder, 60)
-    total_str = f"{total_hours:02d}:{total_minutes:02d}:{total_secs:02d}"
+    builder = ReportBuilder()
+    builder.add(
+        f"📈 *Отчет за период {period_str}*",
+        "",
+        f"*Всего времени: {format_duration(summary['total_seconds'])}*",
+        f"*Записей: {summary['total_count']}*",
+        "",
+        "*По месяцам:*" if summary["by_month"] else "*По дням:*",
+    )
+    for period, seconds, count in summary["periods"]:
+        if not summary["by_month"]:
+            period = f"{period} ({WEEKDAY_NAMES[date.fromisoformat(period).weekday()]})"
+        builder.add(f"• {period}: {format_duration(seconds)} ({count})")
+
+    builder.add("", "*По задачам:*")
+    top_tasks = summary["tasks"][:RANGE_REPORT_TOP_TASKS]
+    for task_num, seconds, count in top_tasks:
+        builder.add(f"• {md_bold(task_num)}: {format_duration(seconds)} ({count})")
+    rest = summary["tasks"][RANGE_REPORT_TOP_TASKS:]
+    if rest:
+        rest_seconds = sum(seconds for _, seconds, _ in rest)
+        builder.add(f"• …и ещё {len(rest)} задач: {format_duration(rest_seconds)}")
+
+    for chunk in builder.chunks():
+        await message.answer(
+            chunk,
+            reply_markup=get_main_keyboard(),
+            parse_mode="Markdown",
+        )
 
-    report_text = f"📊 *Отчет за {date_str}*\n\n"
-    report_text += f"*Всего времени: {total_str}*\n\n"
 
-    for task_num, duration, start_time, description in tasks:
-        hours, remainder = divmod(duration, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        task_time = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        report_text += f"• *{task_num}*: {task_time} ({start_time})\n"
-        if description:
-            report_text += f"  └ {description}\n"
+def report_description(description: str) -> str:
+    if len(description) > REPORT_DESCRIPTION_LEN:
+        description = description[: REPORT_DESCRIPTION_LEN - 1] + "…"
+    return md_escape(description)
 
-    await message.answer(
-        report_text,
-        reply_markup=get_main_keyboard(),
-        parse_mode="Markdown",
-    )
 
+def invalidate_reports(user_id: int, date_str: str, task_number: str):
+    """Сбрасывает кэш отчетов, которые затрагивает запись задачи"""
+    report_cache.invalidate(user_id, "date", date_str)
+    report_cache.invalidate(user_id, "task", task_number)
 
-async def send_report_for_task(user_id: int, task_number: str, message: types.Message):
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT date, duration, time_start, description
-        FROM tasks
-        WHERE user_id = ? AND task_number = ?
-        ORDER BY date, time_start
-        """,
-        (user_id, task_number),
-    )
-    tasks = cursor.fetchall()
-    conn.close()
 
-    if not tasks:
-        await message.answer(
-            f"📋 Нет данных для задачи *{task_number}*.",
-            parse_mode="Markdown",
-            reply_markup=get_main_keyboard(),
+async def send_report_page(message: types.Message, page: tuple[str, str | None]):
+    """Отправляет страницу отчета (текст, callback «Ещё» или None)"""
+    text, more_callback = page
+    if more_callback:
+        reply_markup = InlineKeyboardMarkup(
+            inline_keyboard=[[InlineKeyboardButton(text="▶ Ещё", callback_data=more_callback)]]
         )
-        return
+    else:
+        reply_markup = get_main_keyboard()
+    await message.answer(text, reply_markup=reply_markup, parse_mode="Markdown")
 
-    tasks_by_date: dict[str, list[tuple[int, str, str | None]]] = {}
-    total_duration = 0
 
-    for task_date, duration, time_start, description in tasks:
-        tasks_by_date.setdefault(task_date, []).append(
-            (duration, time_start, description)
-        )
-        total_duration += duration
+async def send_report_for_date(
+    user_id: int, report_date: date, message: types.Message, after: tuple[str, int] | None = None
+):
+    """Отчет за день; after=(time_start, id) — последняя показанная запись"""
+    date_str = report_date.isoformat()
+    page = report_cache.get(user_id, "date", date_str, after)
+    if page is MISSING:
+        version = report_cache.version(user_id, "date", date_str)
+        page = await render_report_for_date(user_id, date_str, after)
+        report_cache.set(user_id, "date", date_str, after, page, version)
+    await send_report_page(message, page)
 
-    total_hours, remainder = divmod(total_duration, 3600)
-    total_minutes, total_secs = divmod(remainder, 60)
-    total_str = f"{total_hours:02d}:{total_minutes:02d}:{total_secs:02d}"
 
-    report_text = f"📋 *Отчет по задаче: {task_number}*\n\n"
-    report_text += f"*Всего времени: {total_str}*\n"
-    report_text += f"*Записей: {len(tasks)}*\n\n"
+async def render_report_for_date(
+    user_id: int, date_str: str, after: tuple[str, int] | None
+) -> tuple[str, str | None]:
+    """Страница отчета за день: (текст, callback «Ещё» или None)"""
+    tasks, has_more = await db.get_tasks_for_date_page(user_id, date_str, after, REPORT_PAGE_ROWS)
 
-    for task_date in sorted(tasks_by_date.keys()):
-        day_entries = tasks_by_date[task_date]
-        day_duration = sum(entry[0] for entry in day_entries)
-        day_hours, remainder = divmod(day_duration, 3600)
-        day_minutes, day_secs = divmod(remainder, 60)
-        day_str = f"{day_hours:02d}:{day_minutes:02d}:{day_secs:02d}"
+    if not tasks:
+        text = f"📊 За {date_str} задач нет." if after is None else f"📊 Больше задач за {date_str} нет."
+        return text, None
 
-        report_text += f"📅 *{task_date}* ({day_str})\n"
+    builder = ReportBuilder()
+    if after is None:
+        if has_more:
+            total_duration, _ = await db.get_day_totals(user_id, date_str)
+        else:
+            total_duration = sum(task[2] for task in tasks)
+        builder.add(
+            f"📊 *Отчет за {date_str}*",
+            "",
+            f"*Всего времени: {format_duration(total_duration)}*",
+            "",
+        )
+    else:
+        builder.add(f"📊 *Отчет за {date_str}* (продолжение)", "")
 
-        for duration, time_start, description in day_entries:
-            hours, remainder = divmod(duration, 3600)
-            minutes, seconds = divmod(remainder, 60)
-            entry_time = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-            report_text += f"  • {time_start}: {entry_time}\n"
-            if description:
-                report_text += f"    └ {description}\n"
+    last = None
+    for task_id, task_num, duration, start_time, description in tasks:
+        lines = [f"• {md_bold(task_num)}: {format_duration(duration)} ({start_time})"]
+        if description:
+            lines.append(f"  └ {report_description(description)}")
+        if last and not builder.fits(*lines):
+            has_more = True
+            break
+        builder.add(*lines)
+        last = (start_time, task_id)
+
+    more_callback = f"rd:{date_str}:{last[0]}:{last[1]}" if has_more else None
+    return builder.text(), more_callback
+
+
+async def send_report_for_task(
+    user_id: int, task_number: str, message: types.Message, after: tuple[str, str, int] | None = None
+):
+    """Отчет по задаче; after=(date, time_start, id) — последняя показанная запись"""
+    page = report_cache.get(user_id, "task", task_number, after)
+    if page is MISSING:
+        version = report_cache.version(user_id, "task", task_number)
+        page = await render_report_for_task(user_id, task_number, after)
+        report_cache.set(user_id, "task", task_number, after, page, version)
+    await send_report_page(message, page)
+
+
+async def render_report_for_task(
+    user_id: int, task_number: str, after: tuple[str, str, int] | None
+) -> tuple[str, str | None]:
+    """Страница отчета по задаче: (текст, callback «Ещё» или None)"""
+    task = await db.get_catalog_task(user_id, task_number)
+    tasks, has_more = [], False
+    if task:
+        tasks, has_more = await db.get_tasks_for_task_page(
+            user_id, task_number, after, REPORT_PAGE_ROWS
+        )
 
-        report_text += "\n"
+    if not tasks:
+        text = (
+            f"📋 Нет данных для задачи {md_bold(task_number)}."
+            if after is None else "📋 Больше записей по задаче нет."
+        )
+        return text, None
+
+    # итоги дней только для дат этой страницы
+    day_totals = await db.get_task_day_totals(user_id, task_number, tasks[0][1], tasks[-1][1])
+
+    builder = ReportBuilder()
+    if after is None:
+        builder.add(
+            f"📋 *Отчет по задаче:* {md_bold(task_number)}",
+            "",
+            f"*Всего времени: {format_duration(task['total_seconds'])}*",
+            f"*Записей: {task['usage_count']}*",
+        )
+    else:
+        builder.add(f"📋 *Отчет по задаче:* {md_bold(task_number)} (продолжение)")
+
+    last = None
+    current_date = None
+    for task_id, task_date, duration, time_start, description in tasks:
+        lines = []
+        if task_date != current_date:
+            lines += ["", f"📅 *{task_date}* ({format_duration(day_totals.get(task_date, 0))})"]
+        lines.append(f"  • {time_start}: {format_duration(duration)}")
+        if description:
+            lines.append(f"    └ {report_description(description)}")
+        if last and not builder.fits(*lines):
+            has_more = True
+            break
+        builder.add(*lines)
+        current_date = task_date
+        last = (task_date, time_start, task_id)
 
-    await message.answer(
-        report_text,
-        reply_markup=get_main_keyboard(),
-        parse_mode="Markdown",
-    )
+    more_callback = f"rt:{task['id']}:{last[0]}:{last[1]}:{last[2]}" if has_more else None
+    return builder.text(), more_callback
 
 
 @dp.message(F.text == "📊 Отчет за сегодня")
@@ -919,15 +819,45 @@ async def ask_report_date(message: types.Message, state: FSMContext):
     today = date.today()
     await state.set_state(TaskTimer.choosing_calendar_month)
     await message.answer(
-        "📅 Выберите дату для отчета:",
-        reply_markup=get_calendar_keyboard(today.year, today.month),
+        "📅 Выберите дату для отчета (• — есть записи):",
+        reply_markup=await get_user_calendar(
+            message.from_user.id, today.year, today.month, only_marked=True
+        ),
+    )
+
+
+@dp.message(TaskTimer.waiting_reports_menu, F.text == "📈 Отчет за период")
+async def ask_report_range(message: types.Message, state: FSMContext):
+    await state.clear()
+    await message.answer(
+        "📈 Выберите период:",
+        reply_markup=get_range_presets_keyboard(),
     )
 
 
+@dp.message(Command("report"))
+async def report_range_command(message: types.Message, state: FSMContext):
+    """Команда: /report YYYY-MM-DD [YYYY-MM-DD] — отчет за период"""
+    await state.clear()
+    try:
+        dates = [date.fromisoformat(part) for part in message.text.split()[1:3]]
+    except ValueError:
+        dates = []
+    if not dates:
+        await message.answer(
+            "❌ Используй: /report с YYYY-MM-DD [по YYYY-MM-DD]",
+            reply_markup=get_main_keyboard(),
+        )
+        return
+
+    date_to = dates[1] if len(dates) > 1 else date.today()
+    await send_range_report(message.from_user.id, dates[0], date_to, message)
+
+
 @dp.message(TaskTimer.waiting_reports_menu, F.text == "📋 Отчет по задаче")
 async def ask_report_task(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    tasks_kb = get_tasks_keyboard(user_id)
+    tasks_kb = await get_tasks_keyboard(user_id)
 
     if not tasks_kb:
         await state.clear()
@@ -944,52 +874,43 @@ async def ask_report_task(message: types.Message, state: FSMContext):
     )
 
 
-@dp.message(TaskTimer.waiting_reports_menu, F.text == "📥 Экспорт в CSV")
-async def export_to_csv(message: types.Message, state: FSMContext):
-    """Экспортирует данные в CSV"""
-    user_id = message.from_user.id
-    await state.clear()
-
-    if not is_premium_or_admin(user_id):
-        kb = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(
-                        text="💎 Купить премиум (99 ₽)", callback_data="buy_premium"
-                    )
-                ]
-            ]
-        )
-        await message.answer(
-            "❌ Доступ к экспорту в CSV доступен только премиум-пользователям.\n\n"
-            "Оформите премиум за 99 ₽, чтобы выгружать свои задачи в CSV. | Чтобы вернуться в главное меню отправьте мне любой символ.",
-            reply_markup=kb,
-        )
-        return
+async def send_premium_offer(message: types.Message):
+    await message.answer(
+        "❌ Доступ к экспорту в CSV доступен только премиум-пользователям.\n\n"
+        "Оформите премиум за 99 ₽, чтобы выгружать свои задачи в CSV. | Чтобы вернуться в главное меню отправьте мне любой символ.",
+        reply_markup=PREMIUM_OFFER_KEYBOARD,
+    )
 
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM tasks WHERE user_id = ?", (user_id,))
-    task_count = cursor.fetchone()[0]
-    conn.close()
 
-    if task_count == 0:
-        await message.answer(
-            "❌ У вас нет записей о задачах для экспорта.",
-            reply_markup=get_main_keyboard(),
+async def send_csv_export(
+    message: types.Message, user_id: int, date_from: date | None = None, date_to: date | None = None
+):
+    """Формирует CSV вне event loop и отправляет его с диска"""
+    csv_path = None
+    try:
+        csv_path, task_count = await db.generate_csv_report(
+            user_id,
+            date_from.isoformat() if date_from else None,
+            date_to.isoformat() if date_to else None,
         )
-        return
 
-    try:
-        csv_file = generate_csv_report(user_id)
-        csv_file.seek(0)
+        if task_count == 0:
+            await message.answer(
+                "❌ У вас нет записей о задачах для экспорта.",
+                reply_markup=get_main_keyboard(),
+            )
+            return
+
+        period = ""
+        if date_from or date_to:
+            period = f"\n📅 Период: {date_from or '…'} — {date_to or '…'}"
 
         await message.answer_document(
-            document=types.BufferedInputFile(
-                file=csv_file.getvalue(),
+            document=types.FSInputFile(
+                csv_path,
                 filename=f"tasks_report_{date.today().isoformat()}.csv",
             ),
-            caption=f"📊 Отчет по вашим задачам\n📋 Всего записей: {task_count}",
+            caption=f"📊 Отчет по вашим задачам\n📋 Всего записей: {task_count}{period}",
         )
         await message.answer(
             "✅ Готово!",
@@ -1001,6 +922,46 @@ async def export_to_csv(message: types.Message, state: FSMContext):
             f"❌ Ошибка создания файла: {str(e)}",
             reply_markup=get_main_keyboard(),
         )
+    finally:
+        if csv_path:
+            csv_path.unlink(missing_ok=True)
+
+
+@dp.message(TaskTimer.waiting_reports_menu, F.text == "📥 Экспорт в CSV")
+async def export_to_csv(message: types.Message, state: FSMContext):
+    """Экспортирует данные в CSV"""
+    user_id = message.from_user.id
+    await state.clear()
+
+    if not await is_premium_or_admin(user_id):
+        await send_premium_offer(message)
+        return
+
+    await send_csv_export(message, user_id)
+
+
+@dp.message(Command("export"))
+async def export_range_to_csv(message: types.Message, state: FSMContext):
+    """Команда: /export [YYYY-MM-DD] [YYYY-MM-DD] — экспорт за период"""
+    user_id = message.from_user.id
+    await state.clear()
+
+    if not await is_premium_or_admin(user_id):
+        await send_premium_offer(message)
+        return
+
+    try:
+        dates = [date.fromisoformat(part) for part in message.text.split()[1:3]]
+    except ValueError:
+        await message.answer(
+            "❌ Используй: /export [с YYYY-MM-DD] [по YYYY-MM-DD]",
+            reply_markup=get_main_keyboard(),
+        )
+        return
+
+    date_from = dates[0] if dates else None
+    date_to = dates[1] if len(dates) > 1 else None
+    await send_csv_export(message, user_id, date_from, date_to)
 
 
 @dp.message(TaskTimer.waiting_reports_menu, F.text == "🔙 Назад")
@@ -1047,7 +1008,7 @@ async def successful_payment(message: types.Message):
     if not payload.startswith("premium_"):
         return
 
-    set_premium_status(user_id, 1)
+    await db.set_premium_status(user_id, 1)
     await message.answer(
         "✅ Премиум активирован!\nТеперь вам доступен экспорт задач в CSV.",
         reply_markup=get_main_keyboard(),
@@ -1069,7 +1030,8 @@ async def start_msg_to_all(message: types.Message, state: FSMContext):
         "📢 Отправьте сообщение для рассылки всем пользователям:\n"
         "- Текстовое сообщение\n"
         "- Или фото с текстом (caption)\n\n"
-        "Для отмены используйте команду /cancel до начала отправки.",
+        "Для отмены используйте команду /cancel до начала отправки.\n"
+        "После запуска рассылкой можно управлять: /broadcast_status.",
         reply_markup=get_main_keyboard(),
     )
     await state.set_state(TaskTimer.waiting_msg_to_all_message)
@@ -1084,7 +1046,8 @@ async def admin_stats(message: types.Message):
         )
         return
 
-    stats = get_statistics()
+    # окно 7 дней — по тем же серверным датам, которыми помечаются задачи
+    stats = await db.get_statistics(date.today())
     report = (
         "📊 СТАТИСТИКА БОТА\n\n"
         f"👥 Всего пользователей: {stats['total_users']}\n"
@@ -1092,10 +1055,27 @@ async def admin_stats(message: types.Message):
         f"📋 Всего задач: {stats['total_tasks']}\n"
         f"⏱️ Всего часов: {stats['total_hours']}\n"
         f"💰 Среднее/пользователя: {stats['avg_hours']} часов\n"
+        f"🚫 Заблокировали бота: {await db.count_unreachable_users()}\n"
     )
     await message.answer(report, reply_markup=get_main_keyboard())
 
 
+@dp.message(Command("rebuild_stats"))
+async def admin_rebuild_stats(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        await message.answer(
+            "❌ Доступ запрещен. Эта команда только для администратора.",
+            reply_markup=get_main_keyboard(),
+        )
+        return
+
+    await db.rebuild_aggregates()
+    await message.answer(
+        "✅ Агрегаты статистики пересчитаны.",
+        reply_markup=get_main_keyboard(),
+    )
+
+
 @dp.message(Command("user_list"))
 async def admin_user_list(message: types.Message):
     if message.from_user.id != ADMIN_ID:
@@ -1105,23 +1085,55 @@ async def admin_user_list(message: types.Message):
         )
         return
 
-    users = get_all_users()
+    await send_users_page(message, after_user_id=0, start_idx=1)
+
+
+async def send_users_page(message: types.Message, after_user_id: int, start_idx: int):
+    """Отправляет страницу /user_list, начиная с user_id > after_user_id"""
+    users, has_more = await db.get_users_page(after_user_id, USERS_PAGE_SIZE)
 
-    if not users:
+    if not users and after_user_id == 0:
         await message.answer(
             "📋 Пока нет пользователей.",
             reply_markup=get_main_keyboard(),
         )
         return
 
-    report = f"📋 ВСЕ ПОЛЬЗОВАТЕЛИ ({len(users)})\n\n"
-    for idx, user in enumerate(users, 1):
-        report += (
+    if after_user_id == 0:
+        header = f"📋 ВСЕ ПОЛЬЗОВАТЕЛИ ({await db.count_users()})\n\n"
+    else:
+        header = "📋 ПОЛЬЗОВАТЕЛИ (продолжение)\n\n"
+
+    lines = [header]
+    length = len(header)
+    last_user_id = after_user_id
+    idx = start_idx
+    for user in users:
+        line = (
             f"{idx}️⃣ @{user['username']} | {user['first_name']} | "
             f"Присоединился: {user['joined_date']} | {user['total_hours']} часов\n"
         )
+        # не выходим за лимит сообщения Telegram — остаток уйдёт на следующую страницу
+        if length + len(line) > TELEGRAM_MESSAGE_LIMIT and idx > start_idx:
+            has_more = True
+            break
+        lines.append(line)
+        length += len(line)
+        last_user_id = user["user_id"]
+        idx += 1
+
+    if has_more:
+        reply_markup = InlineKeyboardMarkup(
+            inline_keyboard=[[
+                InlineKeyboardButton(
+                    text="▶ Далее", callback_data=f"users:{last_user_id}:{idx}"
+                )
+            ]]
+        )
+    else:
+        reply_markup = get_main_keyboard()
 
-    await message.answer(report, reply_markup=get_main_keyboard())
+    await message.answer("".join(lines), reply_markup=reply_markup)
 
 
 @dp.message(Command("user"))
@@ -1142,7 +1154,7 @@ async def admin_user_info(message: types.Message):
         )
         return
 
-    stats = get_user_stats(user_id)
+    stats = await db.get_user_stats(user_id)
     report = (
         "👤 ИНФОРМАЦИЯ О ПОЛЬЗОВАТЕЛЕ\n\n"
         f"Username: @{stats['username']}\n"
@@ -1157,6 +1169,163 @@ async def admin_user_info(message: types.Message):
     await message.answer(report, reply_markup=get_main_keyboard())
 
 
+@dp.message(Command("db_stats"))
+async def admin_db_stats(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        await message.answer(
+            "❌ Доступ запрещен. Эта команда только для администратора.",
+            reply_markup=get_main_keyboard(),
+        )
+        return
+
+    stats = db.pool_stats()
+    report = (
+        "🗄 ПУЛ СОЕДИНЕНИЙ БД\n\n"
+        f"Размер пула: {stats['size']}\n"
+        f"Занято сейчас: {stats['in_use']}\n"
+        f"Максимум занято: {stats['max_in_use']}\n"
+        f"Выдач соединений: {stats['checkouts']}\n"
+        f"Ожиданий свободного: {stats['waits']}\n"
+        f"Суммарное ожидание: {stats['wait_ms_total']} мс\n"
+    )
+    for name, cache_stats in {
+        **db.cache_stats(),
+        "calendar": calendar_cache.stats(),
+        "reports": report_cache.stats(),
+    }.items():
+        report += (
+            f"\nКэш {name}: {cache_stats['size']}/{cache_stats['maxsize']}, "
+            f"попаданий {cache_stats['hits']}, промахов {cache_stats['misses']} "
+            f"({cache_stats['hit_rate']:.0%})"
+        )
+    write_stats = db.write_stats()
+    report += (
+        f"\nГрупповая запись: {write_stats['ops']} операций за {write_stats['batches']} "
+        f"транзакций, максимум в пачке {write_stats['max_batch']}"
+    )
+    if live_status.enabled:
+        live_stats = live_status.stats()
+        report += (
+            f"\nЖивой статус: таймеров {live_stats['tracked']}, правок {live_stats['sent']}, "
+            f"ошибок {live_stats['failed']}, с опозданием {live_stats['late']}"
+        )
+    if hasattr(storage, "stats"):
+        fsm_stats = storage.stats()
+        report += (
+            f"\nFSM: в памяти {fsm_stats['cached']}, ждут записи {fsm_stats['dirty']}, "
+            f"записей в БД {fsm_stats['rows_written']} за {fsm_stats['flushes']} транзакций"
+        )
+    await message.answer(report, reply_markup=get_main_keyboard())
+
+
+# Сколько строк обработчиков и запросов показывать в /metrics
+METRICS_TOP = 10
+
+
+@dp.message(Command("metrics"))
+async def admin_metrics(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        await message.answer(
+            "❌ Доступ запрещен. Эта команда только для администратора.",
+            reply_markup=get_main_keyboard(),
+        )
+        return
+
+    registry = metrics.metrics
+    uptime = max(time.time() - registry.started_at, 1)
+    updates = registry.counter_values("timebot_updates_total", "type")
+    errors = registry.counter_values("timebot_handler_errors_total", "handler")
+    total_updates = int(sum(updates.values()))
+
+    builder = ReportBuilder()
+    builder.add(
+        "📈 МЕТРИКИ ПРОЦЕССА",
+        "",
+        f"Работает: {format_duration(int(uptime))}",
+        f"Апдейтов: {total_updates} ({total_updates / uptime:.2f}/с)",
+    )
+    for update_type, count in sorted(updates.items(), key=lambda item: -item[1]):
+        builder.add(f"  {update_type}: {int(count)}")
+    throttled = registry.counter_values("timebot_throttled_total", "reason")
+    if throttled:
+        builder.add("Отброшено: " + ", ".join(f"{reason} {int(count)}" for reason, count in sorted(throttled.items())))
+
+    builder.add("", "Обработчики (вызовы, ср., p99, ошибки):")
+    for row in registry.histogram_summary("timebot_handler_duration_seconds", "handler")[:METRICS_TOP]:
+        builder.add(
+            f"• {row['handler']}: {row['count']}, {row['avg_ms']:.1f} мс, "
+            f"{row['p99_ms']:.1f} мс, {int(errors.get(row['handler'], 0))}"
+        )
+
+    builder.add("", "Запросы к БД (вызовы, ср., p99):")
+    for row in registry.histogram_summary("timebot_db_query_duration_seconds", "query")[:METRICS_TOP]:
+        builder.add(f"• {row['query']}: {row['count']}, {row['avg_ms']:.2f} мс, {row['p99_ms']:.2f} мс")
+
+    builder.add("", "Ожидание БД (раз, ср., p99):")
+    for row in registry.histogram_summary("timebot_db_wait_seconds", "kind"):
+        builder.add(f"• {row['kind']}: {row['count']}, {row['avg_ms']:.2f} мс, {row['p99_ms']:.2f} мс")
+
+    for chunk in builder.chunks():
+        await message.answer(chunk, reply_markup=get_main_keyboard())
+
+
+@dp.message(Command("profile"))
+async def admin_profile(message: types.Message):
+    """Команда: /profile [on [порог_мс]|off|get]"""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer(
+            "❌ Доступ запрещен. Эта команда только для администратора.",
+            reply_markup=get_main_keyboard(),
+        )
+        return
+
+    parts = message.text.split()
+    action = parts[1] if len(parts) > 1 else ""
+
+    if action == "on":
+        try:
+            if len(parts) > 2:
+                profiler.threshold_ms = float(parts[2])
+        except ValueError:
+            await message.answer(
+                "❌ Неверный формат. Пример: /profile on 300",
+                reply_markup=get_main_keyboard(),
+            )
+            return
+        profiler.enabled = True
+    elif action == "off":
+        profiler.enabled = False
+    elif action == "get":
+        latest = profiler.latest()
+        if latest is None:
+            await message.answer("Профилей пока нет.", reply_markup=get_main_keyboard())
+            return
+        await message.answer_document(
+            document=types.FSInputFile(latest),
+            caption=f"🐢 {latest.name}\nФормат folded: flamegraph.pl или speedscope",
+        )
+        return
+    elif action:
+        await message.answer(
+            "Использование: /profile [on [порог_мс]|off|get]",
+            reply_markup=get_main_keyboard(),
+        )
+        return
+
+    status = "включено" if profiler.enabled else "выключено"
+    report = (
+        "🐢 ПРОФИЛИРОВАНИЕ МЕДЛЕННЫХ ОБРАБОТЧИКОВ\n\n"
+        f"Состояние: {status}\n"
+        f"Порог: {profiler.threshold_ms:.0f} мс\n"
+        f"Выборок стеков: {profiler.samples}\n"
+        f"Сохранено профилей: {profiler.dumps}\n"
+    )
+    recent = profiler.profiles()[:5]
+    if recent:
+        report += "\nПоследние:\n" + "\n".join(path.name for path in recent)
+    await message.answer(report, reply_markup=get_main_keyboard())
+
+
 @dp.message(Command("admin_help"))
 async def admin_help(message: types.Message):
     if message.from_user.id != ADMIN_ID:
@@ -1169,11 +1338,19 @@ async def admin_help(message: types.Message):
     help_text = (
         "🔧 АДМИН КОМАНДЫ\n\n"
         "/stats - Общая статистика бота\n"
+        "/rebuild_stats - Пересчитать агрегаты статистики\n"
         "/user_list - Список всех пользователей\n"
         "/user <user_id> - Информация о пользователе\n"
         "/premium <user_id> <0|1> - Включить/выключить премиум у пользователя\n"
         "/broadcast - Рассылка сообщения (только пользователям без премиум)\n"
         "/msg_to_all - Рассылка всем пользователям\n"
+        "/broadcast_status [id] - Прогресс рассылок\n"
+        "/broadcast_pause <id> - Приостановить рассылку\n"
+        "/broadcast_resume <id> - Продолжить рассылку\n"
+        "/broadcast_cancel <id> - Отменить рассылку\n"
+        "/db_stats - Статистика пула соединений БД и кэшей\n"
+        "/metrics - Задержки обработчиков и запросов к БД\n"
+        "/profile [on [мс]|off|get] - Профили медленных обработчиков\n"
         "/admin_help - Эта справка\n"
     )
     await message.answer(help_text, reply_markup=get_main_keyboard())
@@ -1198,6 +1375,29 @@ async def start_broadcast(message: types.Message, state: FSMContext):
     await state.set_state(TaskTimer.waiting_broadcast_message)
 
 
+async def launch_broadcast(
+    message: types.Message,
+    state: FSMContext,
+    kind: str,
+    text: str | None,
+    photo_id: str | None,
+    user_ids: list[int],
+    audience: str,
+):
+    """Ставит рассылку в очередь и сразу освобождает админа"""
+    await state.clear()
+    job_id = await db.create_broadcast(message.chat.id, kind, text, photo_id, user_ids)
+    broadcasts.start(job_id)
+
+    what = "фото" if kind == "photo" else "сообщения"
+    await message.answer(
+        f"📤 Рассылка #{job_id} {what} запущена: {len(user_ids)} {audience}.\n"
+        f"Прогресс: /broadcast_status {job_id}\n"
+        f"Пауза: /broadcast_pause {job_id} | Отмена: /broadcast_cancel {job_id}",
+        reply_markup=get_main_keyboard(),
+    )
+
+
 @dp.message(TaskTimer.waiting_broadcast_message, F.photo)
 async def send_broadcast_with_photo(message: types.Message, state: FSMContext):
     """Рассылка с фото"""
@@ -1207,7 +1407,7 @@ async def send_broadcast_with_photo(message: types.Message, state: FSMContext):
     photo_id = message.photo[-1].file_id
     caption = message.caption or ""
 
-    non_premium_users = get_non_premium_users()
+    non_premium_users = await db.get_non_premium_users(ADMIN_ID)
 
     if not non_premium_users:
         await state.clear()
@@ -1217,34 +1417,9 @@ async def send_broadcast_with_photo(message: types.Message, state: FSMContext):
         )
         return
 
-    await message.answer(
-        f"📤 Начинаю рассылку фото {len(non_premium_users)} пользователям без премиума...",
-        reply_markup=get_main_keyboard(),
-    )
-
-    success_count = 0
-    error_count = 0
-
-    for user_id in non_premium_users:
-        try:
-            await bot.send_photo(
-                chat_id=user_id,
-                photo=photo_id,
-                caption=caption,
-                parse_mode="Markdown" if caption else None,
-            )
-            success_count += 1
-            await asyncio.sleep(0.05)
-        except Exception as e:
-            error_count += 1
-            print(f"Ошибка отправки пользователю {user_id}: {e}")
-
-    await state.clear()
-    await message.answer(
-        f"✅ Рассылка завершена!\n"
-        f"✅ Успешно: {success_count}\n"
-        f"❌ Ошибок: {error_count}",
-        reply_markup=get_main_keyboard(),
+    await launch_broadcast(
+        message, state, "photo", caption, photo_id, non_premium_users,
+        "пользователям без премиума",
     )
 
 
@@ -1254,7 +1429,7 @@ async def msg_to_all_text(message: types.Message, state: FSMContext):
         return
 
     broadcast_text = message.text.strip()
-    user_ids = get_all_user_ids()
+    user_ids = await db.get_all_user_ids()
 
     if not user_ids:
         await state.clear()
@@ -1264,29 +1439,8 @@ async def msg_to_all_text(message: types.Message, state: FSMContext):
         )
         return
 
-    await message.answer(
-        f"📤 Начинаю рассылку всем {len(user_ids)} пользователям...",
-        reply_markup=get_main_keyboard(),
-    )
-
-    success_count = 0
-    error_count = 0
-
-    for user_id in user_ids:
-        try:
-            await bot.send_message(user_id, broadcast_text, parse_mode="Markdown")
-            success_count += 1
-            await asyncio.sleep(0.05)
-        except Exception as e:
-            error_count += 1
-            print(f"Ошибка отправки пользователю {user_id}: {e}")
-
-    await state.clear()
-    await message.answer(
-        f"✅ Рассылка завершена!\n"
-        f"✅ Успешно: {success_count}\n"
-        f"❌ Ошибок: {error_count}",
-        reply_markup=get_main_keyboard(),
+    await launch_broadcast(
+        message, state, "text", broadcast_text, None, user_ids, "пользователям"
     )
 
 
@@ -1297,7 +1451,7 @@ async def msg_to_all_photo(message: types.Message, state: FSMContext):
 
     photo_id = message.photo[-1].file_id
     caption = message.caption or ""
-    user_ids = get_all_user_ids()
+    user_ids = await db.get_all_user_ids()
 
     if not user_ids:
         await state.clear()
@@ -1307,34 +1461,8 @@ async def msg_to_all_photo(message: types.Message, state: FSMContext):
         )
         return
 
-    await message.answer(
-        f"📤 Начинаю рассылку фото {len(user_ids)} пользователям...",
-        reply_markup=get_main_keyboard(),
-    )
-
-    success_count = 0
-    error_count = 0
-
-    for user_id in user_ids:
-        try:
-            await bot.send_photo(
-                chat_id=user_id,
-                photo=photo_id,
-                caption=caption,
-                parse_mode="Markdown" if caption else None,
-            )
-            success_count += 1
-            await asyncio.sleep(0.05)
-        except Exception as e:
-            error_count += 1
-            print(f"Ошибка отправки пользователю {user_id}: {e}")
-
-    await state.clear()
-    await message.answer(
-        f"✅ Рассылка завершена!\n"
-        f"✅ Успешно: {success_count}\n"
-        f"❌ Ошибок: {error_count}",
-        reply_markup=get_main_keyboard(),
+    await launch_broadcast(
+        message, state, "photo", caption, photo_id, user_ids, "пользователям"
     )
 
 
@@ -1345,7 +1473,7 @@ async def send_broadcast_text(message: types.Message, state: FSMContext):
         return
 
     broadcast_text = message.text.strip()
-    non_premium_users = get_non_premium_users()
+    non_premium_users = await db.get_non_premium_users(ADMIN_ID)
 
     if not non_premium_users:
         await state.clear()
@@ -1355,32 +1483,98 @@ async def send_broadcast_text(message: types.Message, state: FSMContext):
         )
         return
 
-    await message.answer(
-        f"📤 Начинаю рассылку {len(non_premium_users)} пользователям без премиума...",
-        reply_markup=get_main_keyboard(),
+    await launch_broadcast(
+        message, state, "text", broadcast_text, None, non_premium_users,
+        "пользователям без премиума",
     )
 
-    success_count = 0
-    error_count = 0
 
-    for user_id in non_premium_users:
-        try:
-            await bot.send_message(user_id, broadcast_text, parse_mode="Markdown")
-            success_count += 1
-            await asyncio.sleep(0.05)
-        except Exception as e:
-            error_count += 1
-            print(f"Ошибка отправки пользователю {user_id}: {e}")
+BROADCAST_STATUS_NAMES = {
+    "running": "▶️ идёт",
+    "paused": "⏸ на паузе",
+    "cancelled": "⛔️ отменена",
+    "done": "✅ завершена",
+}
+
+
+def format_broadcast(job: dict) -> str:
+    return (
+        f"📢 Рассылка #{job['id']} от {job['created_at']}: "
+        f"{BROADCAST_STATUS_NAMES.get(job['status'], job['status'])}\n"
+        f"Всего: {job['total']} | ✅ {job['sent']} | ❌ {job['failed']} | "
+        f"🚫 {job['unreachable']} | ⏳ {job['pending']}\n"
+    )
+
+
+def parse_job_id(message: types.Message) -> int | None:
+    try:
+        return int(message.text.split()[1])
+    except (IndexError, ValueError):
+        return None
+
+
+@dp.message(Command("broadcast_status"))
+async def admin_broadcast_status(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        await message.answer(
+            "❌ Доступ запрещен. Эта команда только для администратора.",
+            reply_markup=get_main_keyboard(),
+        )
+        return
+
+    job_id = parse_job_id(message)
+    if job_id is None:
+        jobs = await db.get_recent_broadcasts()
+    else:
+        job = await db.get_broadcast(job_id)
+        jobs = [job] if job else []
+
+    if not jobs:
+        await message.answer("📢 Рассылок не найдено.", reply_markup=get_main_keyboard())
+        return
 
-    await state.clear()
     await message.answer(
-        f"✅ Рассылка завершена!\n"
-        f"✅ Успешно: {success_count}\n"
-        f"❌ Ошибок: {error_count}",
+        "\n".join(format_broadcast(job) for job in jobs),
         reply_markup=get_main_keyboard(),
     )
 
 
+@dp.message(Command("broadcast_pause", "broadcast_resume", "broadcast_cancel"))
+async def admin_broadcast_control(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        await message.answer(
+            "❌ Доступ запрещен. Эта команда только для администратора.",
+            reply_markup=get_main_keyboard(),
+        )
+        return
+
+    command = message.text.split()[0].lstrip("/").split("@")[0]
+    job_id = parse_job_id(message)
+    if job_id is None:
+        await message.answer(
+            f"❌ Используй: /{command} <id рассылки>",
+            reply_markup=get_main_keyboard(),
+        )
+        return
+
+    if command == "broadcast_pause":
+        ok = await broadcasts.pause(job_id)
+    elif command == "broadcast_resume":
+        ok = await broadcasts.resume(job_id)
+    else:
+        ok = await broadcasts.cancel(job_id)
+
+    job = await db.get_broadcast(job_id)
+    if not ok or not job:
+        await message.answer(
+            f"❌ Не удалось выполнить /{command} для рассылки #{job_id}.",
+            reply_markup=get_main_keyboard(),
+        )
+        return
+
+    await message.answer(format_broadcast(job), reply_markup=get_main_keyboard())
+
+
 @dp.message(Command("premium"))
 async def admin_set_premium(message: types.Message):
     """Команда: /premium <user_id> <0|1>"""
@@ -1410,7 +1604,7 @@ async def admin_set_premium(message: types.Message):
             )
             return
 
-        if set_premium_status(user_id, status):
+        if await db.set_premium_status(user_id, status):
             await message.answer(
                 f"✅ Пользователь {user_id}: премиум = {status}",
                 reply_markup=get_main_keyboard(),
@@ -1437,8 +1631,14 @@ async def handle_calendar_navigation(callback: types.CallbackQuery, state: FSMCo
             return
 
         year, month = int(parts[1]), int(parts[2])
+        if not 1 <= month <= 12:
+            raise ValueError(month)
+        # в выборе периода доступны все дни, в отчете за дату — только с записями
+        only_marked = await state.get_state() == TaskTimer.choosing_calendar_month.state
         await callback.message.edit_reply_markup(
-            reply_markup=get_calendar_keyboard(year, month)
+            reply_markup=await get_user_calendar(
+                callback.from_user.id, year, month, only_marked
+            )
         )
         await callback.answer()
     except (ValueError, IndexError):
@@ -1457,6 +1657,26 @@ async def handle_date_selection(callback: types.CallbackQuery, state: FSMContext
         selected_date = date(year, month, day)
         user_id = callback.from_user.id
 
+        # тот же календарь выбирает начало и конец периода
+        current_state = await state.get_state()
+        if current_state == TaskTimer.choosing_range_start.state:
+            await state.update_data(range_start=selected_date.isoformat())
+            await state.set_state(TaskTimer.choosing_range_end)
+            await callback.message.edit_text(
+                f"📈 Начало: {selected_date.isoformat()}\nВыберите конец периода:",
+                reply_markup=callback.message.reply_markup,
+            )
+            await callback.answer()
+            return
+        if current_state == TaskTimer.choosing_range_end.state:
+            data = await state.get_data()
+            await callback.message.delete()
+            await state.clear()
+            await send_range_report(
+                user_id, date.fromisoformat(data["range_start"]), selected_date, callback.message
+            )
+            return
+
         await callback.message.delete()
         await state.clear()
         await send_report_for_date(user_id, selected_date, callback.message)
@@ -1464,16 +1684,39 @@ async def handle_date_selection(callback: types.CallbackQuery, state: FSMContext
         await callback.answer("Ошибка при обработке даты", show_alert=False)
 
 
-@dp.callback_query(F.data.startswith("task:"))
+@dp.callback_query(F.data.startswith("range:"))
+async def handle_range_preset(callback: types.CallbackQuery, state: FSMContext):
+    preset = callback.data.split(":", 1)[1]
+    today = date.today()
+
+    if preset == "pick":
+        await state.set_state(TaskTimer.choosing_range_start)
+        await callback.message.edit_text(
+            "📈 Выберите начало периода:",
+            reply_markup=await get_user_calendar(callback.from_user.id, today.year, today.month),
+        )
+        await callback.answer()
+        return
+
+    bounds = period_bounds(preset, today)
+    if bounds is None:
+        await callback.answer("Неизвестный период", show_alert=False)
+        return
+
+    await callback.message.delete()
+    await state.clear()
+    await send_range_report(callback.from_user.id, *bounds, callback.message)
+
+
+@dp.callback_query(F.data.startswith("tc:"))
 async def handle_task_selection(callback: types.CallbackQuery, state: FSMContext):
+    """Кнопка задачи из каталога: tc:<id записи каталога>"""
     try:
-        parts = callback.data.split(":", 1)
-        if len(parts) < 2:
-            await callback.answer("Ошибка выбора задачи", show_alert=False)
-            return
-
-        task_number = parts[1]
         user_id = callback.from_user.id
+        task_number = await db.get_catalog_task_name(user_id, int(callback.data.split(":", 1)[1]))
+        if task_number is None:
+            await callback.answer("Задача не найдена", show_alert=False)
+            return
 
         await callback.message.delete()
         await state.clear()
@@ -1482,6 +1725,122 @@ async def handle_task_selection(callback: types.CallbackQuery, state: FSMContext
         await callback.answer("Ошибка при обработке задачи", show_alert=False)
 
 
+@dp.callback_query(F.data.startswith("task:"))
+async def handle_task_selection_by_name(callback: types.CallbackQuery, state: FSMContext):
+    """Кнопки старого формата: task:<название задачи>"""
+    parts = callback.data.split(":", 1)
+    if len(parts) < 2 or not parts[1]:
+        await callback.answer("Ошибка выбора задачи", show_alert=False)
+        return
+
+    await callback.message.delete()
+    await state.clear()
+    await send_report_for_task(callback.from_user.id, parts[1], callback.message)
+
+
+@dp.callback_query(F.data.startswith("tasks:"))
+async def handle_tasks_page(callback: types.CallbackQuery):
+    try:
+        page = max(0, int(callback.data.split(":", 1)[1]))
+    except ValueError:
+        await callback.answer("Ошибка навигации", show_alert=False)
+        return
+
+    tasks_kb = await get_tasks_keyboard(callback.from_user.id, page)
+    await callback.answer()
+    if tasks_kb:
+        await callback.message.edit_reply_markup(reply_markup=tasks_kb)
+
+
+@dp.inline_query()
+async def search_tasks_inline(inline_query: types.InlineQuery):
+    """Inline-поиск задачи для отчета: @бот <часть названия>"""
+    user_id = inline_query.from_user.id
+    query = inline_query.query.strip()
+    if query:
+        tasks = await db.search_task_catalog(user_id, query, limit=50)
+    else:
+        tasks, _ = await db.get_task_catalog_page(user_id, 0, 50)
+
+    results = []
+    for task in tasks:
+        hours, remainder = divmod(task["total_seconds"], 3600)
+        minutes, seconds = divmod(remainder, 60)
+        results.append(
+            InlineQueryResultArticle(
+                id=str(task["id"]),
+                title=task["name"],
+                description=f"Записей: {task['usage_count']}, всего {hours:02d}:{minutes:02d}:{seconds:02d}",
+                input_message_content=InputTextMessageContent(
+                    message_text=TASK_REPORT_PREFIX + task["name"]
+                ),
+            )
+        )
+    await inline_query.answer(results, cache_time=5, is_personal=True)
+
+
+@dp.message(F.via_bot.id == bot.id, F.text.startswith(TASK_REPORT_PREFIX))
+async def report_task_from_inline(message: types.Message, state: FSMContext):
+    await state.clear()
+    task_number = message.text[len(TASK_REPORT_PREFIX):].strip()
+    await send_report_for_task(message.from_user.id, task_number, message)
+
+
+@dp.callback_query(F.data.startswith("rd:"))
+async def handle_date_report_more(callback: types.CallbackQuery):
+    try:
+        _, date_str, rest = callback.data.split(":", 2)
+        time_start, task_id = rest.rsplit(":", 1)
+        report_date, after = date.fromisoformat(date_str), (time_start, int(task_id))
+    except ValueError:
+        await callback.answer("Ошибка навигации", show_alert=False)
+        return
+
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await send_report_for_date(callback.from_user.id, report_date, callback.message, after)
+
+
+@dp.callback_query(F.data.startswith("rt:"))
+async def handle_task_report_more(callback: types.CallbackQuery):
+    try:
+        _, catalog_id, task_date, rest = callback.data.split(":", 3)
+        time_start, task_id = rest.rsplit(":", 1)
+        after = (task_date, time_start, int(task_id))
+        catalog_id = int(catalog_id)
+    except ValueError:
+        await callback.answer("Ошибка навигации", show_alert=False)
+        return
+
+    user_id = callback.from_user.id
+    task_number = await db.get_catalog_task_name(user_id, catalog_id)
+    if task_number is None:
+        await callback.answer("Задача не найдена", show_alert=False)
+        return
+
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await send_report_for_task(user_id, task_number, callback.message, after)
+
+
+@dp.callback_query(F.data.startswith("users:"))
+async def handle_users_page(callback: types.CallbackQuery):
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("❌ Доступ запрещен", show_alert=False)
+        return
+
+    try:
+        _, after_user_id, start_idx = callback.data.split(":")
+        after_user_id, start_idx = int(after_user_id), int(start_idx)
+    except ValueError:
+        await callback.answer("Ошибка навигации", show_alert=False)
+        return
+
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await send_users_page(callback.message, after_user_id, start_idx)
+
+
 @dp.callback_query(F.data == "cancel_calendar")
 async def cancel_calendar(callback: types.CallbackQuery, state: FSMContext):
     await callback.message.delete()
@@ -1502,6 +1861,11 @@ async def cancel_tasks(callback: types.CallbackQuery, state: FSMContext):
     )
 
 
+@dp.callback_query(F.data == "noday")
+async def empty_day_callback(callback: types.CallbackQuery):
+    await callback.answer("📭 За этот день записей нет", show_alert=False)
+
+
 @dp.callback_query(F.data == "noop")
 async def noop_callback(callback: types.CallbackQuery):
     await callback.answer()
@@ -1509,9 +1873,58 @@ async def noop_callback(callback: types.CallbackQuery):
 
 # ================== ЗАПУСК БОТА ==================
 async def main():
-    print("🤖 Бот запущен!")
-    await dp.start_polling(bot)
+    if BOT_MODE == "webhook":
+        # без секрета не стартуем ещё до восстановления таймеров и рассылок
+        require_secret(WEBHOOK_SECRET)
+    restored = await active_timers.all()
+    if restored:
+        print(f"⏳ Восстановлено запущенных таймеров: {len(restored)}")
+        for user_id, timer in restored.items():
+            # таймеры пользователей других шардов обновляют их шарды
+            if SHARD_INDEX is not None and shard_for_user(user_id, BOT_WORKERS) != SHARD_INDEX:
+                continue
+            if timer.get("status_message_id"):
+                live_status.track(
+                    user_id,
+                    timer["status_chat_id"],
+                    timer["status_message_id"],
+                    timer["task_number"],
+                    timer["start_time"],
+                )
+    # рассылками управляет админ, поэтому их ведёт шард админа
+    if SHARD_INDEX is None or SHARD_INDEX == shard_for_user(ADMIN_ID, BOT_WORKERS):
+        resumed = await broadcasts.resume_unfinished()
+        if resumed:
+            print(f"📤 Продолжено незавершённых рассылок: {resumed}")
+    shard = f", шард {SHARD_INDEX + 1}/{BOT_WORKERS}" if SHARD_INDEX is not None else ""
+    print(f"🤖 Бот запущен! Режим: {BOT_MODE}{shard}")
+
+    metrics_runner = None
+    if metrics.METRICS_PORT:
+        # у каждого шарда свой порт метрик
+        port = metrics.METRICS_PORT + (SHARD_INDEX + 1 if SHARD_INDEX is not None else 0)
+        try:
+            metrics_runner = await metrics.start_server(metrics.METRICS_HOST, port)
+        except OSError as e:
+            print(f"⚠️ Не удалось запустить эндпоинт метрик на порту {port}: {e}")
+    try:
+        if BOT_MODE == "webhook":
+            await WebhookServer(dp, bot).serve()
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await live_status.close()
+        await broadcasts.shutdown()
+        await db.flush_writes()
+        # дописываем отложенные FSM-состояния до закрытия пула
+        await storage.close()
+        db.shutdown()
+        if metrics_runner:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
+    # роутер шардов запускается выше, до инициализации базы
+    if BOT_WORKERS > 1 and BOT_MODE != "webhook":
+        print("⚠️ BOT_WORKERS > 1 поддерживается только в режиме webhook")
     asyncio.run(main())
\ No newline at end of file
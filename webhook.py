@@ -0,0 +1,159 @@
+import asyncio
+import hmac
+import os
+import signal
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+
+# ================== НАСТРОЙКИ WEBHOOK ==================
+# Публичный адрес бота (https://example.com); пусто — webhook не регистрируется
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -); без него webhook не стартует
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+# Очередь апдейтов: при переполнении отвечаем 429, и Telegram повторит доставку позже
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "32"))
+# Сколько секунд ждать обработки очереди при остановке
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def require_secret(secret: str) -> str:
+    """Webhook без секрета принимал бы апдейты от кого угодно — такой запуск запрещён"""
+    if not secret:
+        raise ValueError("Для режима webhook задайте WEBHOOK_SECRET")
+    return secret
+
+
+def secret_matches(request: web.Request, secret: str) -> bool:
+    """Сравнение заголовка с секретом за постоянное время"""
+    return hmac.compare_digest(request.headers.get(SECRET_HEADER, "").encode(), secret.encode())
+
+
+class WebhookServer:
+    """Приём апдейтов через aiohttp с ограниченной очередью и мягкой остановкой"""
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        path: str = WEBHOOK_PATH,
+        secret: str = WEBHOOK_SECRET,
+        queue_size: int = WEBHOOK_QUEUE_SIZE,
+        workers: int = WEBHOOK_WORKERS,
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = require_secret(secret)
+        self.workers = workers
+        self.queue: asyncio.Queue[types.Update] = asyncio.Queue(maxsize=queue_size)
+        self._closing = False
+        self._worker_tasks: list[asyncio.Task] = []
+
+        # статистика
+        self.accepted = 0
+        self.rejected = 0
+        self.unauthorized = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not secret_matches(request, self.secret):
+            self.unauthorized += 1
+            return web.Response(status=401)
+        if self._closing:
+            return web.Response(status=503)
+
+        try:
+            update = types.Update.model_validate(
+                await request.json(), context={"bot": self.bot}
+            )
+        except Exception:
+            return web.Response(status=400)
+
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return web.Response(status=429)
+
+        self.accepted += 1
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "queued": self.queue.qsize(),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "unauthorized": self.unauthorized,
+        })
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                print(f"Ошибка обработки апдейта {update.update_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def serve(
+        self,
+        host: str = WEBAPP_HOST,
+        port: int = WEBAPP_PORT,
+        base_url: str = WEBHOOK_BASE_URL,
+        stop_event: asyncio.Event | None = None,
+    ):
+        """Запускает сервер и работает до SIGINT/SIGTERM (или stop_event)"""
+        stop_event = stop_event or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+        if base_url:
+            await self.bot.set_webhook(
+                base_url.rstrip("/") + self.path,
+                secret_token=self.secret,
+                allowed_updates=self.dp.resolve_used_update_types(),
+            )
+        print(f"🌐 Webhook слушает {host}:{port}{self.path}")
+
+        try:
+            await stop_event.wait()
+        finally:
+            await self.shutdown(site, runner)
+
+    async def shutdown(self, site: web.TCPSite, runner: web.AppRunner):
+        """Перестаёт принимать апдейты и дожидается обработки уже принятых"""
+        self._closing = True
+        await site.stop()
+        try:
+            await asyncio.wait_for(self.queue.join(), WEBHOOK_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Не обработано апдейтов при остановке: {self.queue.qsize()}")
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        await runner.cleanup()
+        await self.bot.session.close()